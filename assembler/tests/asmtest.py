@@ -0,0 +1,47 @@
+"""Shared helpers for the assembler test scripts: puts the assembler and the
+simulator on sys.path, counts PASS/FAIL checks, and runs the zx16asm.py CLI.
+Each test_*.py imports it from its own directory, so it still runs alone:
+    from asmtest import A, Z, check, cli_bin, finish
+"""
+import os, sys, subprocess, tempfile
+HERE = os.path.dirname(os.path.abspath(__file__))
+ASM_DIR = os.path.dirname(HERE)
+ROOT = os.path.dirname(ASM_DIR)
+sys.path.insert(0, ASM_DIR)
+sys.path.insert(0, os.path.join(ROOT, "simulator"))
+import zx16asm as A                      # noqa: E402
+import zx16sim as Z                      # noqa: E402
+ASM = os.path.join(ASM_DIR, "zx16asm.py")
+
+npass = ntot = 0
+def check(label, cond, got=None):
+    global npass, ntot
+    ntot += 1; npass += bool(cond)
+    print(("PASS " if cond else "FAIL ") + label + ("" if cond else f"   got={got}"))
+
+def finish(what):
+    """Print the tally and exit non-zero if any check failed."""
+    print(f"\n{npass}/{ntot} {what} tests passed")
+    sys.exit(0 if npass == ntot else 1)
+
+def assemble(src, peephole=True):
+    asm = A.ZX16Assembler(); asm.peephole = peephole
+    ok = asm.assemble(src)
+    return ok, asm
+
+def run_cli(*args):
+    """Run zx16asm.py with args; the CompletedProcess, output as text."""
+    return subprocess.run([sys.executable, ASM, *args], capture_output=True, text=True)
+
+def cli_bin(src, *flags):
+    """Assemble src with the CLI; the .bin bytes, or None if it failed."""
+    with tempfile.TemporaryDirectory() as tmp:
+        s, b = os.path.join(tmp, "p.s"), os.path.join(tmp, "p.bin")
+        with open(s, "w") as f: f.write(src)
+        r = run_cli(s, "-o", b, *flags)
+        return open(b, "rb").read() if "successfully" in r.stdout else None
+
+def final_regs(image):
+    """Registers after running a 64KB image on the simulator to its halt."""
+    sim = Z.ZX16(); sim.load(image, 0x0000); sim.run()
+    return sim.reg
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""ZX16Assembler.assemble_files: several files assembled in worker processes
+must match assembling each file alone with the same options (including
+peephole=False), keep the input order, and report unreadable or non-UTF-8
+files as errors of that file alone.
+Run: python3 test_assemble_files.py
+"""
+import os, tempfile
+from asmtest import A, check, finish
+
+PROGRAMS = [
+    # LI of 0x1000 has bits [6:0] clear, so the peephole changes its size
+    ".text\nmain:\n    li a0, 0x1000\n    li a1, 5\n    j main\n",
+    ".text\n    call f\n    ecall 0x3FF\nf:\n    li16 x6, 1234\n    ret\n"
+    ".data\nmsg: .string \"hi\"\n",
+    ".text\n    la a0, buf\n    sw a1, 0(a0)\n.bss\nbuf: .space 4\n",
+]
+
+def alone(src, peephole):
+    asm = A.ZX16Assembler(); asm.peephole = peephole
+    asm.assemble(src)
+    return asm
+
+def same(a, b):
+    return (a.get_binary_output() == b.get_binary_output()
+            and a._symbol_values == b._symbol_values
+            and [e.message for e in a.errors] == [e.message for e in b.errors])
+
+with tempfile.TemporaryDirectory() as tmp:
+    paths = []
+    for i, src in enumerate(PROGRAMS):
+        paths.append(os.path.join(tmp, f"p{i}.s"))
+        with open(paths[-1], "w") as f: f.write(src)
+
+    for peephole in (True, False):
+        for workers in (None, 1):
+            got = A.ZX16Assembler.assemble_files(paths, max_workers=workers, peephole=peephole)
+            check(f"peephole={peephole} max_workers={workers}: matches per-file assembly",
+                  len(got) == len(PROGRAMS)
+                  and all(same(g, alone(src, peephole)) for g, src in zip(got, PROGRAMS)))
+            check(f"peephole={peephole} max_workers={workers}: option kept on results",
+                  all(g.peephole == peephole for g in got))
+
+    on, off = (A.ZX16Assembler.assemble_files(paths, max_workers=2, peephole=p)[0]
+               for p in (True, False))
+    check("peephole option reaches the worker (LI 0x1000 is 2 vs 4 bytes)",
+          len(on.sections['.text']) + 2 == len(off.sections['.text']),
+          (len(on.sections['.text']), len(off.sections['.text'])))
+
+    undecodable = os.path.join(tmp, "bad.s")
+    with open(undecodable, "wb") as f: f.write(b"\xff\xfe nop\n")
+    for workers in (None, 1):
+        got = A.ZX16Assembler.assemble_files([paths[0], undecodable, paths[1]],
+                                             max_workers=workers)
+        check(f"max_workers={workers}: non-UTF-8 file reported as its own error",
+              len(got) == 3 and not got[0].errors and not got[2].errors
+              and len(got[1].errors) == 1
+              and got[1].errors[0].message.startswith(f"Error reading input file '{undecodable}'")
+              and "decode" in got[1].errors[0].message,
+              [e.message for g in got for e in g.errors])
+
+    missing = os.path.join(tmp, "missing.s")
+    got = A.ZX16Assembler.assemble_files([paths[0], missing])
+    check("unreadable file reported as an error, others unaffected",
+          not got[0].errors and len(got[1].errors) == 1
+          and got[1].errors[0].message.startswith(f"Error reading input file '{missing}'"),
+          [e.message for g in got for e in g.errors])
+
+finish("assemble_files")
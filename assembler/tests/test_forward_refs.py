@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Single-pass forward references: the fixup list must give the bytes a
+two-pass assembler would. The reference is the same program with every
+forward symbol replaced by its value (worked out by hand from the layout),
+so nothing in it is forward. Also checks that a forward LI reserves the
+4-byte form and that an undefined symbol is reported at its own line.
+Run: python3 test_forward_refs.py
+"""
+from asmtest import assemble, check, final_regs, finish
+
+# {li} is LI for the forward program and LI16 for the reference: a forward
+# LI cannot know its value yet, so it must take the 4-byte form.
+TEMPLATE = """.text
+main:
+    {li} x6, {far}
+    la x7, {far}
+    jal ra, {sub}
+    beq x6, x7, {skip}
+    li x4, 1
+skip:
+    j {end}
+    li x4, 2
+end:
+    ecall 0x3FF
+sub:
+    li x5, 9
+    jr ra
+.data
+far: .word 0x1234
+"""
+# main=0x20: li 0x20 (4), la 0x24 (4), jal 0x28, beq 0x2A, li 0x2C, j 0x2E, li 0x30
+LAYOUT = {"main": 0x20, "skip": 0x2E, "end": 0x32, "sub": 0x34, "far": 0x8000}
+fwd = TEMPLATE.format(li="li", **{k: k for k in LAYOUT})
+ref = TEMPLATE.format(li="li16", **{k: hex(v) for k, v in LAYOUT.items()})
+
+ok_f, f = assemble(fwd)
+ok_r, r = assemble(ref)
+check("forward program assembles", ok_f, [e.message for e in f.errors])
+check("reference program assembles", ok_r, [e.message for e in r.errors])
+check("label addresses follow the hand layout",
+      all(f._symbol_values[k] == v for k, v in LAYOUT.items()),
+      {k: f._symbol_values.get(k) for k in LAYOUT})
+check("same bytes as the two-pass reference", f.get_binary_output() == r.get_binary_output())
+
+text = f.sections[".text"]
+for name, at in (("JAL", 0x28), ("BEQ", 0x2A), ("J", 0x2E)):
+    got = text[at - 0x20:at - 0x1E]
+    check(f"forward {name} displacement", got == r.sections[".text"][at - 0x20:at - 0x1E], got.hex())
+
+regs = final_regs(f.get_binary_output())
+check("forward LI/LA load the data address", regs[6] == regs[7] == 0x8000, (regs[6], regs[7]))
+check("forward JAL reaches sub", regs[5] == 9, regs[5])
+check("forward BEQ and J are taken", regs[4] == 0, regs[4])
+
+# A forward LI keeps 4 bytes even when the value would fit the short form
+ok, asm = assemble(".text\n    li x6, small\nnext:\n    ecall 0x3FF\n.equ small, 5\n")
+check("forward LI of a small value reserves 4 bytes",
+      ok and asm._symbol_values["next"] == 0x24, asm._symbol_values.get("next"))
+
+# Undefined symbols are found only at fixup time but report their own line,
+# in source order with the errors found along the way
+src = ".text\n    j nowhere\n    add x1, x9\n    li x6, missing\n    ecall 0x3FF\n"
+ok, asm = assemble(src)
+got = [(e.line, e.message) for e in asm.errors]
+check("undefined symbols fail the assembly", not ok)
+check("undefined forward J reported at line 2",
+      (2, "Unknown symbol 'nowhere'") in got, got)
+check("undefined forward LI reported at line 4",
+      (4, "Unknown symbol 'missing'") in got, got)
+check("errors in source order", [line for line, _ in got] == sorted(line for line, _ in got), got)
+
+finish("forward-reference")
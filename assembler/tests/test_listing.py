@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Output and listing files: separate paths are written on a thread pool and
+must each hold their own content; a listing that names the output's own
+file (the same path, another spelling of it, or a hard link) is written
+after the output and always wins. Write errors are reported, exit 1.
+Run: python3 test_listing.py
+"""
+import os, tempfile
+from asmtest import assemble, check, finish, run_cli
+
+SRC = (".text\nmain:\n    li a0, 0x1000\n    la a1, msg\n    ecall 0x3FF\n"
+       ".data\nmsg: .string \"hello\"\n")
+ok, asm = assemble(SRC)
+IMAGE = asm.get_binary_output()
+LISTING = asm.get_listing_output(SRC.splitlines()).encode("utf-8")
+
+def read(path):
+    with open(path, "rb") as f: return f.read()
+
+with tempfile.TemporaryDirectory() as tmp:
+    src = os.path.join(tmp, "p.s")
+    with open(src, "w") as f: f.write(SRC)
+    out, lst = os.path.join(tmp, "p.bin"), os.path.join(tmp, "p.lst")
+
+    r = run_cli(src, "-o", out, "-l", lst, "-v")
+    check("separate paths: exit 0", r.returncode == 0, r.stderr)
+    check("separate paths: output is the image", read(out) == IMAGE)
+    check("separate paths: listing is the listing", read(lst) == LISTING)
+    check("separate paths: both reported written",
+          f"Output written to {out}\nListing written to {lst}\n" in r.stdout, r.stdout)
+
+    same = [read(out) if run_cli(src, "-o", out, "-l", out).returncode == 0 else None
+            for _ in range(8)]
+    check("-o X -l X: the listing wins every run", all(got == LISTING for got in same),
+          [got and len(got) for got in same])
+
+    os.remove(out)
+    os.mkdir(os.path.join(tmp, "sub"))
+    other = os.path.join(tmp, "sub", os.pardir, "p.bin")
+    r = run_cli(src, "-o", out, "-l", other)
+    check("another spelling of the output path: the listing wins",
+          r.returncode == 0 and read(out) == LISTING)
+
+    link = os.path.join(tmp, "link.bin")
+    os.link(out, link)
+    r = run_cli(src, "-o", out, "-l", link)
+    check("a hard link to the output: the listing wins",
+          r.returncode == 0 and read(out) == read(link) == LISTING)
+
+    r = run_cli(src, "-o", out, "-l", os.path.join(tmp, "missing", "p.lst"))
+    check("unwritable listing: error reported, exit 1",
+          r.returncode == 1 and "Error writing output file" in r.stderr, r.stderr)
+
+finish("listing")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""LI peephole: an out-of-range LI whose bits [6:0] are clear assembles to LUI
+alone. Checks that --no-peephole reproduces the LUI+ORI (LI16) bytes, that the
+short form leaves the same register values on the ZX16 sim, and that label
+addresses after each LI follow the size rule instruction_size() uses.
+Run: python3 test_peephole.py
+"""
+from asmtest import assemble, check, cli_bin, final_regs, finish
+
+# In range, low 7 bits clear (incl. negative and the 16-bit extremes), and
+# out of range with low bits set (the LUI+ORI form either way)
+VALUES = [5, -64, 63, 64, -65, 0x80, 0x1000, 0x7F80, -128, -0x1000, -0x8000,
+          0xFF80, 0x1234, 0x7FFF, 200]
+def size(imm):
+    if -64 <= imm <= 63: return 2
+    return 2 if imm & 0x7F == 0 else 4
+
+REGS = ["x6", "x7", "x5", "x4"]
+def program(li):
+    """One LI (or LI16 via li(reg, imm)) per value, each followed by a label."""
+    lines = [".text", ".org 0x0020"]
+    for i, imm in enumerate(VALUES):
+        lines += [li(REGS[i % len(REGS)], imm), f"after{i}:"]
+    lines.append("    ecall 0x3FF")
+    return "\n".join(lines) + "\n"
+
+def li(reg, imm): return f"    li {reg}, {imm}"
+def li16(reg, imm):
+    return f"    li {reg}, {imm}" if -64 <= imm <= 63 else f"    li16 {reg}, {imm}"
+
+src, ref = program(li), program(li16)
+
+# 1) --no-peephole == the LUI+ORI expansion, via the CLI and the attribute
+base = cli_bin(ref)
+check("--no-peephole reproduces the LI16 (LUI+ORI) bytes", cli_bin(src, "--no-peephole") == base)
+ok, off = assemble(src, peephole=False)
+check("peephole=False reproduces the LI16 bytes", ok and off.get_binary_output() == base)
+
+# 2) the short form computes the same values
+ok, on = assemble(src)
+check("peephole output assembles", ok, [e.message for e in on.errors])
+check("default CLI output matches peephole=True", cli_bin(src) == on.get_binary_output())
+regs_on, regs_off = final_regs(on.get_binary_output()), final_regs(base)
+check("same final registers with and without the peephole", regs_on == regs_off,
+      (regs_on, regs_off))
+check("registers hold the last LI of each (16-bit)",
+      all(regs_on[int(REGS[i % len(REGS)][1])] == VALUES[i] & 0xFFFF
+          for i in range(len(VALUES) - len(REGS), len(VALUES))), regs_on)
+
+# 3) sizes: label addresses follow imm & 0x7F, and only the peephole differs
+addr = addr_off = 0x0020
+want_on, want_off = {}, {}
+for i, imm in enumerate(VALUES):
+    addr += size(imm); want_on[f"after{i}"] = addr
+    addr_off += 2 if -64 <= imm <= 63 else 4; want_off[f"after{i}"] = addr_off
+got_on = {k: v for k, v in on._symbol_values.items() if k.startswith("after")}
+got_off = {k: v for k, v in off._symbol_values.items() if k.startswith("after")}
+check("label addresses with the peephole", got_on == want_on, got_on)
+check("label addresses without the peephole", got_off == want_off, got_off)
+check("short form is LUI alone", all(
+    on.get_binary_output()[want_on[f"after{i}"] - 2] & 0x7 == 0b110
+    for i, imm in enumerate(VALUES) if size(imm) == 2 and not -64 <= imm <= 63))
+
+# 4) a forward-referenced LI keeps the 4-byte form even if the value qualifies
+fwd = ".text\n    li x6, K\nnext:\n    ecall 0x3FF\n.equ K, 0x1000\n"
+ok, asm = assemble(fwd)
+check("forward LI reserves 4 bytes", ok and asm._symbol_values["next"] == 0x24,
+      asm._symbol_values.get("next"))
+check("forward LI loads the value", final_regs(asm.get_binary_output())[6] == 0x1000)
+
+finish("peephole")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Register operands: the encoders add fields together, so a register
+number past 0..7 would carry into the neighbouring field. Checks that every
+in-range register encodes as the baseline's shift-and-or packing does, and
+that an out-of-range one (given as a number) is an error at its line.
+Run: python3 test_registers.py
+"""
+from asmtest import assemble, check, finish
+
+def words(asm):
+    text = asm.sections[".text"]
+    return [text[i] | text[i + 1] << 8 for i in range(0, len(text), 2)]
+
+# R-Type: funct4[15:12] | rs2[11:9] | rd[8:6] | func3[5:3] | opcode 000
+R = {"add": (0x0, 0x0), "sub": (0x1, 0x0), "slt": (0x2, 0x1), "or": (0x7, 0x4),
+     "xor": (0x9, 0x6), "mv": (0xa, 0x7)}
+src = ".text\n" + "".join(f"    {m} {rd}, {rs2}\n"
+                          for m in R for rd in range(8) for rs2 in range(8))
+ok, asm = assemble(src)
+want = [f4 << 12 | rs2 << 9 | rd << 6 | f3 << 3
+        for f4, f3 in R.values() for rd in range(8) for rs2 in range(8)]
+check("numeric registers 0..7 assemble", ok, [e.message for e in asm.errors][:3])
+check("in-range registers match shift-and-or packing", words(asm) == want)
+
+# x-names and ABI aliases are the same numbers
+ok, a = assemble(".text\n    sub x6, x7\n")
+ok2, b = assemble(".text\n    sub a0, a1\n")
+check("SUB a0, a1 is 0x1F80 (as baseline)", ok and ok2 and words(a) == words(b) == [0x1F80],
+      (words(a), words(b)))
+
+BAD = [
+    ("sub a0, 8", "sub", 8),             # R rs2 (carried into funct4)
+    ("add 9, x1", "add", 9),             # R rd
+    ("jr 8", "jr", 8),
+    ("addi 8, 1", "addi", 8),            # I rd
+    ("slli 15, 2", "slli", 15),
+    ("beq x1, 8, 0x20", "beq", 8),       # B rs2
+    ("bz 8, 0x20", "bz", 8),
+    ("sw 8, 0(x2)", "sw", 8),            # S rs2
+    ("lw 8, 0(x2)", "lw", 8),            # L rd
+    ("jal 8, 0x20", "jal", 8),
+    ("lui 8, 1", "lui", 8),
+    ("mfepc 8", "mfepc", 8),
+    ("push 12", "push", 12),             # via a pseudo-instruction's expansion
+    ("addi -1, 1", "addi", -1),
+]
+for line, mnemonic, reg in BAD:
+    ok, asm = assemble(f".text\n    nop\n    {line}\n    nop\n")
+    got = [(e.line, e.message) for e in asm.errors]
+    check(f"{line}: rejected at line 3", not ok and got == [(
+        3, f"Error encoding instruction '{mnemonic}': Register number out of range (0-7): {reg}")],
+        got)
+
+finish("register operand")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""--trim: the trimmed .bin must be a prefix of the padded 64KB image that
+ends with the highest section, the rest of the padded image must be zeros,
+and the default (untrimmed) output must stay the full image unchanged.
+Run: python3 test_trim.py
+"""
+from asmtest import A, check, cli_bin, finish
+
+# (name, source, expected trimmed length)
+PROGRAMS = [
+    ("text only", ".text\n    li a0, 5\n    ecall 0x3FF\n", 0x24),
+    ("text and data", ".text\n    la a0, msg\n    ecall 0x3FF\n"
+     ".data\nmsg: .string \"hi\"\n", 0x8003),
+    ("bss is highest", ".text\n    ecall 0x3FF\n.data\n    .word 1\n"
+     ".bss\nbuf: .space 6\n", 0x9006),
+]
+
+for name, src, length in PROGRAMS:
+    asm = A.ZX16Assembler()
+    asm.assemble(src)
+    image = bytearray(65536)             # the layout the simulator loads
+    for sec in (".text", ".data", ".bss"):
+        at = asm.section_addresses[sec]
+        image[at:at + len(asm.sections[sec])] = asm.sections[sec]
+    full, trimmed = cli_bin(src), cli_bin(src, "--trim")
+    check(f"{name}: default output is the 64KB image",
+          full is not None and len(full) == 65536, full and len(full))
+    check(f"{name}: default output unchanged (sections placed in 64KB)",
+          full == image and asm.get_binary_output() == image)
+    check(f"{name}: trimmed output ends with the highest section",
+          trimmed is not None and len(trimmed) == length, trimmed and hex(len(trimmed)))
+    check(f"{name}: trimmed output is a prefix of the padded image",
+          full is not None and trimmed is not None and full[:len(trimmed)] == trimmed)
+    check(f"{name}: padding past the trimmed end is zeros",
+          full is not None and trimmed is not None and not any(full[len(trimmed):]))
+    check(f"{name}: --trim matches get_binary_output(trim=True)",
+          trimmed == asm.get_binary_output(trim=True))
+
+finish("trim")
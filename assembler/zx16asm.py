@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-ZX16 Assembler - A complete two-pass assembler for the ZX16 RISC architecture.
+ZX16 Assembler - A complete single-pass assembler for the ZX16 RISC architecture.
 
 This assembler supports all ZX16 base instructions, pseudo-instructions, essential
 directives, and multiple output formats including Verilog integration.
@@ -10,17 +10,29 @@ License: MIT
 """
 
 import argparse
+import array
+import bisect
+import codecs
+import concurrent.futures
+import errno
+import functools
+import itertools
 import re
+import string
+import struct
 import sys
 import os
 from dataclasses import dataclass, field
-from enum import Enum, auto
-from typing import Dict, List, Optional, Tuple, Union, Any
+from enum import Enum, IntEnum, auto
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, Any
 from pathlib import Path
 
 
-class TokenType(Enum):
-    """Token types for lexical analysis."""
+class TokenType(IntEnum):
+    """Token types for lexical analysis.
+    
+    An IntEnum so the parser's many type comparisons are plain int compares.
+    """
     INSTRUCTION = auto()
     REGISTER = auto()
     IMMEDIATE = auto()
@@ -37,6 +49,12 @@ class TokenType(Enum):
     EOF = auto()
 
 
+# Token type sets tested once per token by the statement loop
+_SKIPPED_TOKENS = frozenset({TokenType.COMMENT, TokenType.NEWLINE})
+_END_OF_LINE = frozenset({TokenType.NEWLINE, TokenType.EOF})
+_END_OF_OPERANDS = _END_OF_LINE | {TokenType.COMMENT}
+
+
 class OutputFormat(Enum):
     """Supported output formats."""
     BINARY = "bin"
@@ -45,25 +63,59 @@ class OutputFormat(Enum):
     MEMORY = "mem"
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     """Represents a lexical token."""
     type: TokenType
     value: str
     line: int
     column: int
+    # INSTRUCTION: base mnemonic id, DIRECTIVE: directive id (-1 if none);
+    # REGISTER: register number; IMMEDIATE/CHARACTER: the numeric value,
+    # so users need not re-parse value
+    code: int = -1
+
+
+# Diagnostic code -> message format. Diagnostics store the code and the
+# format arguments; the text is only built when a message is read.
+_ERROR_FORMATS = {
+    'internal': "Internal assembler error: {}",
+    'read_error': "Error reading input file '{}': {}",
+    'undefined_symbol': "Undefined symbol '{}'",
+    'unknown_symbol': "Unknown symbol '{}'",
+    'duplicate_symbol': "Symbol '{}' already defined",
+    'encoding': "Error encoding instruction '{}': {}",
+    'org_backward': ".org cannot move backward within a section",
+    'org_address': "Expected address after .org",
+    'equ_undefined': "Undefined symbol '{}' in .equ",
+    'equ_value': "Expected value after symbol name",
+    'equ_name': "Expected symbol name after {}",
+    'global_name': "Expected symbol name after .global",
+    'string_expected': "Expected string after {}",
+    'space_size': "Expected size after .space",
+    'space_negative': ".space size cannot be negative: {}",
+}
 
 
 @dataclass
 class AssemblyError:
-    """Represents an assembly error."""
-    message: str
+    """Represents an assembly error.
+    
+    code is a key of _ERROR_FORMATS and args its format arguments.
+    """
+    code: str
     line: int
     column: int
     severity: str = "Error"  # Error, Warning, Info
+    args: Tuple[Any, ...] = ()
+    
+    @property
+    def message(self) -> str:
+        """The formatted diagnostic text."""
+        return _ERROR_FORMATS[self.code].format(*self.args)
 
 
-@dataclass
+@dataclass(slots=True)
 class Symbol:
     """Represents a symbol in the symbol table."""
     name: str
@@ -73,7 +125,7 @@ class Symbol:
     line: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class Instruction:
     """Represents a decoded instruction."""
     mnemonic: str
@@ -96,252 +148,599 @@ class InstructionFormat(Enum):
     SYS_TYPE = 0b111
 
 
+# Encoding kernels: pure integer bit packing. Callers pass fields
+# already range-checked and masked.
+
+def _sign_extend(value: int, bits: int) -> int:
+    """Sign extend the low `bits` bits of value."""
+    sign_bit = 1 << (bits - 1)
+    mask = (1 << bits) - 1
+    
+    if value & sign_bit:
+        return value | (~mask)
+    return value & mask
+
+
+# Field layouts per format: (argument, shift of its low bit), MSB first.
+#   R/B/S/L: [15:12] funct4/imm4 | [11:9] rs2 | [8:6] rd/rs1 | [5:3] func3
+#   I:       [15:9] imm7 | [8:6] rd | [5:3] func3
+#   J/U:     [15] link/flag | [14:9] imm_high | [8:6] rd | [5:3] imm_low
+#   SYS:     [15:6] svc/rd | [5:3] func3
+# with the format's opcode in [2:0].
+_R_LAYOUT = (('high4', 12), ('rs2', 9), ('rd', 6), ('func3', 3))
+_J_LAYOUT = (('flag', 15), ('imm_high', 9), ('rd', 6), ('imm_low', 3))
+_FORMAT_LAYOUTS = {
+    InstructionFormat.R_TYPE: _R_LAYOUT,
+    InstructionFormat.I_TYPE: (('imm7', 9), ('rd', 6), ('func3', 3)),
+    InstructionFormat.B_TYPE: _R_LAYOUT,
+    InstructionFormat.S_TYPE: _R_LAYOUT,
+    InstructionFormat.L_TYPE: _R_LAYOUT,
+    InstructionFormat.J_TYPE: _J_LAYOUT,
+    InstructionFormat.U_TYPE: _J_LAYOUT,
+    InstructionFormat.SYS_TYPE: (('svc', 6), ('func3', 3)),
+}
+
+
+def _make_packer(fmt: InstructionFormat):
+    """Generate the packing kernel for one format, opcode folded in.
+    
+    The layout is fixed per format, so the kernel is compiled once from
+    source into a single expression with no loop or lookups. Every field
+    is range-checked first (register numbers to 0..7), so fields cannot
+    overlap and are combined as field * 2**shift sums: CPython specializes
+    int + and * but not << and |.
+    """
+    layout = _FORMAT_LAYOUTS[fmt]
+    name = f"_pack_{fmt.name.lower()}"
+    args = ', '.join(arg for arg, _ in layout)
+    expr = ' + '.join(f"{arg} * {1 << shift}" for arg, shift in layout)
+    source = f"def {name}({args}):\n    return {expr} + {fmt.value}\n"
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, f"<{name}>", 'exec'), namespace)
+    packer = namespace[name]
+    fields = ' | '.join(f"{arg} << {shift}" for arg, shift in layout)
+    packer.__doc__ = f"Pack {fmt.name} fields: {fields} | {fmt.value:#05b}."
+    return packer
+
+
+# One kernel per InstructionFormat, indexed by format value
+_PACKERS = tuple(_make_packer(fmt) for fmt in sorted(InstructionFormat, key=lambda f: f.value))
+(_pack_r_type, _pack_i_type, _pack_b_type, _pack_s_type,
+ _pack_l_type, _pack_j_type, _pack_u_type, _pack_sys_type) = _PACKERS
+
+
+# Encoding classes: the operand shape an instruction is checked against.
+# Several classes share one InstructionFormat (e.g. the I-Type shifts).
+(_ENC_R, _ENC_I, _ENC_SHIFT, _ENC_B, _ENC_S, _ENC_L,
+ _ENC_J, _ENC_U, _ENC_SYS, _ENC_SYS_FUNC, _ENC_SYS_REG) = range(11)
+
+# Base instructions: (mnemonic, encoding class, field1, field2). The index
+# of an entry is the mnemonic's id; the lexer tags INSTRUCTION tokens with
+# it, so encoding indexes the tuples below instead of probing a dict per
+# format.
+#   R: funct4, func3     I/B/S/L: func3     SHIFT: shift type
+#   J: link              U: auipc flag      SYS_FUNC/SYS_REG: func3
+_INSTRUCTIONS = (
+    ('add', _ENC_R, 0x0, 0x0), ('sub', _ENC_R, 0x1, 0x0),
+    ('slt', _ENC_R, 0x2, 0x1), ('sltu', _ENC_R, 0x3, 0x2),
+    ('sll', _ENC_R, 0x4, 0x3), ('srl', _ENC_R, 0x5, 0x3),
+    ('sra', _ENC_R, 0x6, 0x3), ('or', _ENC_R, 0x7, 0x4),
+    ('and', _ENC_R, 0x8, 0x5), ('xor', _ENC_R, 0x9, 0x6),
+    ('mv', _ENC_R, 0xa, 0x7), ('jr', _ENC_R, 0xb, 0x0),
+    ('jalr', _ENC_R, 0xc, 0x0),
+    ('addi', _ENC_I, 0x0, 0), ('slti', _ENC_I, 0x1, 0),
+    ('sltui', _ENC_I, 0x2, 0), ('ori', _ENC_I, 0x4, 0),
+    ('andi', _ENC_I, 0x5, 0), ('xori', _ENC_I, 0x6, 0),
+    ('li', _ENC_I, 0x7, 0),  # LI is a real I-Type instruction
+    ('slli', _ENC_SHIFT, 0x1, 0), ('srli', _ENC_SHIFT, 0x2, 0),
+    ('srai', _ENC_SHIFT, 0x4, 0),
+    ('beq', _ENC_B, 0x0, 0), ('bne', _ENC_B, 0x1, 0),
+    ('bz', _ENC_B, 0x2, 0), ('bnz', _ENC_B, 0x3, 0),
+    ('blt', _ENC_B, 0x4, 0), ('bge', _ENC_B, 0x5, 0),
+    ('bltu', _ENC_B, 0x6, 0), ('bgeu', _ENC_B, 0x7, 0),
+    ('sb', _ENC_S, 0x0, 0), ('sw', _ENC_S, 0x1, 0),
+    ('lb', _ENC_L, 0x0, 0), ('lw', _ENC_L, 0x1, 0), ('lbu', _ENC_L, 0x4, 0),
+    ('j', _ENC_J, 0, 0), ('jal', _ENC_J, 1, 0),
+    ('lui', _ENC_U, 0, 0), ('auipc', _ENC_U, 1, 0),
+    ('ecall', _ENC_SYS, 0, 0),
+    # SYS sub-functions (bits[5:3]) -- interrupts/traps, see docs/INTERRUPTS.md
+    ('ebreak', _ENC_SYS_FUNC, 1, 0), ('reti', _ENC_SYS_FUNC, 2, 0),
+    ('ei', _ENC_SYS_FUNC, 3, 0), ('di', _ENC_SYS_FUNC, 4, 0),
+    ('step', _ENC_SYS_FUNC, 7, 0),
+    ('mfepc', _ENC_SYS_REG, 5, 0), ('mtepc', _ENC_SYS_REG, 6, 0),
+)
+
+_MNEMONIC_ID = {entry[0]: i for i, entry in enumerate(_INSTRUCTIONS)}
+# Canonical (lowercase, interned literal) name per mnemonic id
+_MNEMONIC_NAMES = tuple(entry[0] for entry in _INSTRUCTIONS)
+
+# Branches and jumps encode an offset from the current PC; every other
+# encoding is a function of (mnemonic, operands) alone and may be cached.
+_PC_RELATIVE_CLASSES = frozenset((_ENC_B, _ENC_J))
+_ENCODING_CACHE_SIZE = 4096
+
+# Little-endian 16-bit word -> 2 bytes, for emitting encodings and .word
+_pack_halfword = struct.Struct('<H').pack
+
+# Shared zeros for the padding between binary output sections
+_ZEROS = memoryview(bytes(65536))
+
+
+def _zero_fill(size: int) -> Union[bytes, memoryview]:
+    """size zero bytes, as a view of _ZEROS when it is large enough."""
+    return _ZEROS[:size] if size <= len(_ZEROS) else bytes(size)
+
+# Encoders are generated per mnemonic. Each class below is a source
+# template for "def encoder(operands, pc) -> encoding"; _make_encoder fills
+# in the instruction's name and folds its constant fields (funct4/func3,
+# link/flag bits, opcode) into one integer, as computed by the format's
+# packer, so an encoding is a few checks and one sum. Field multipliers
+# follow _FORMAT_LAYOUTS. pc is the address of the instruction. Operands
+# are range-checked here, register numbers included (a field past its
+# width would carry into the next one); SyntaxError reports a malformed
+# instruction.
+
+def _register_error(*registers: int) -> SyntaxError:
+    """The error for an encoder whose register operands are not all 0..7."""
+    bad = next(register for register in registers if register & ~7)
+    return SyntaxError(f"Register number out of range (0-7): {bad}")
+
+
+_ENCODER_SOURCES = {
+    _ENC_R: '''\
+    if len(operands) < 2:
+        raise SyntaxError("R-Type instruction $name requires 2 operands")
+    rd, rs2 = operands[0], operands[1]
+    if (rd | rs2) & ~7:
+        raise _register_error(rd, rs2)
+    return $base + rs2 * 512 + rd * 64
+''',
+    _ENC_I: '''\
+    if len(operands) < 2:
+        raise SyntaxError("I-Type instruction $name requires 2 operands")
+    rd, imm = operands[0], operands[1]
+    if rd & ~7:
+        raise _register_error(rd)
+    if isinstance(imm, str):
+        raise SyntaxError(f"Unresolved symbol in immediate: {imm}")
+    if not isinstance(imm, int):
+        raise SyntaxError(f"Immediate must be an integer or symbol, got {type(imm)}")
+    if not $low <= imm <= $high:
+        raise SyntaxError(f"$range_error{imm}")
+    return (imm & 0x7F) * 512 + rd * 64 + $base
+''',
+    _ENC_SHIFT: '''\
+    if len(operands) < 2:
+        raise SyntaxError("Shift instruction $name requires 2 operands")
+    rd, shift_amt = operands[0], operands[1]
+    if rd & ~7:
+        raise _register_error(rd)
+    if isinstance(shift_amt, str) or shift_amt < 0 or shift_amt > 15:
+        raise SyntaxError(f"Shift amount must be 0-15, got {shift_amt}")
+    return (shift_amt & 0xF) * 512 + rd * 64 + $base
+''',
+    _ENC_B: '''\
+    if len(operands) < 3:
+        raise SyntaxError("Branch instruction $name requires 3 operands")
+    rs1, rs2, target = operands
+    if (rs1 | rs2) & ~7:
+        raise _register_error(rs1, rs2)
+    if isinstance(target, str):
+        raise SyntaxError(f"Unresolved symbol in branch target: {target}")
+    offset = target - (pc + 2)
+    if offset < -32 or offset > 28 or offset % 2 != 0:
+        raise SyntaxError(f"Branch offset out of range or not word-aligned: {offset}")
+    return ((offset >> 1) & 0xF) * 4096 + rs2 * 512 + rs1 * 64 + $base
+''',
+    _ENC_S: '''\
+    if len(operands) < 3:
+        raise SyntaxError("Store instruction $name requires 3 operands")
+    rs2, offset, rs1 = operands
+    if (rs2 | rs1) & ~7:
+        raise _register_error(rs2, rs1)
+    if isinstance(offset, str):
+        raise SyntaxError(f"Unresolved symbol in store offset: {offset}")
+    if offset < -8 or offset > 7:
+        raise SyntaxError(f"Store offset out of range: {offset}")
+    return (offset & 0xF) * 4096 + rs2 * 512 + rs1 * 64 + $base
+''',
+    _ENC_L: '''\
+    if len(operands) < 3:
+        raise SyntaxError("Load instruction $name requires 3 operands")
+    rd, offset, rs2 = operands
+    if (rd | rs2) & ~7:
+        raise _register_error(rd, rs2)
+    if isinstance(offset, str):
+        raise SyntaxError(f"Unresolved symbol in load offset: {offset}")
+    if offset < -8 or offset > 7:
+        raise SyntaxError(f"Load offset out of range: {offset}")
+    return (offset & 0xF) * 4096 + rs2 * 512 + rd * 64 + $base
+''',
+    # The J offset is encoded as imm[9:1] (9 bits) with imm[0]=0 and the
+    # sign bit at bit 9, so the round-trip-safe signed range is -512..+510 --
+    # NOT the -1024..+1022 the prose elsewhere claims. The old -1024..1020
+    # check accepted 511 offsets that silently miscompiled (e.g. +800 would
+    # encode and then decode as -224). Keep the check tight to the encoding.
+    _ENC_J: '''\
+    if len(operands) < 2:
+        raise SyntaxError("JAL instruction requires 2 operands")
+    rd, target = operands
+    if rd & ~7:
+        raise _register_error(rd)
+    if isinstance(target, str):
+        raise SyntaxError(f"Unresolved symbol in jump target: {target}")
+    offset = target - (pc + 2)
+    if offset < -512 or offset > 510 or offset % 2 != 0:
+        raise SyntaxError(f"Jump offset out of range or not word-aligned: {offset}")
+    return ((offset >> 4) & 0x3F) * 512 + rd * 64 + ((offset >> 1) & 0x7) * 8 + $base
+''',
+    _ENC_U: '''\
+    if len(operands) < 2:
+        raise SyntaxError("U-Type instruction $name requires 2 operands")
+    rd, immediate = operands
+    if rd & ~7:
+        raise _register_error(rd)
+    if isinstance(immediate, str):
+        raise SyntaxError(f"Unresolved symbol in U-Type immediate: {immediate}")
+    # U-Type immediate is 9 bits
+    if immediate < 0 or immediate > 0x1FF:
+        raise SyntaxError(f"U-Type immediate out of range: {immediate}")
+    return ((immediate >> 3) & 0x3F) * 512 + rd * 64 + (immediate & 0x7) * 8 + $base
+''',
+    _ENC_SYS: '''\
+    if len(operands) < 1:
+        raise SyntaxError("ECALL instruction requires 1 operand")
+    svc = operands[0]
+    if isinstance(svc, str):
+        raise SyntaxError(f"Unresolved symbol in system call: {svc}")
+    if svc < 0 or svc > 0x3FF:
+        raise SyntaxError(f"System call number out of range (0-1023): {svc}")
+    return $base + svc * 64
+''',
+    # SYS sub-functions (bits[5:3]) -- interrupts/traps, see docs/INTERRUPTS.md
+    _ENC_SYS_FUNC: '''\
+    return $base
+''',
+    # SYS register moves: mfepc / mtepc
+    _ENC_SYS_REG: '''\
+    if len(operands) != 1:
+        raise SyntaxError("$name requires 1 register operand")
+    rd = operands[0]
+    if rd & ~7:
+        raise _register_error(rd)
+    return rd * 64 + $base
+''',
+}
+
+# Instructions whose operand shape differs from the rest of their class
+_ENCODER_SOURCE_OVERRIDES = {
+    # JR only uses rd (first operand), rs2 is ignored
+    'jr': '''\
+    if len(operands) < 1:
+        raise SyntaxError("JR instruction requires at least 1 operand")
+    rd = operands[0]
+    if rd & ~7:
+        raise _register_error(rd)
+    return $base + rd * 64
+''',
+    # BZ/BNZ test rs1 alone; rs2 is encoded as 0
+    'bz': '''\
+    if len(operands) < 2:
+        raise SyntaxError("Branch instruction $name requires 2 operands")
+    rs1, target = operands
+    if rs1 & ~7:
+        raise _register_error(rs1)
+    if isinstance(target, str):
+        raise SyntaxError(f"Unresolved symbol in branch target: {target}")
+    offset = target - (pc + 2)
+    if offset < -32 or offset > 28 or offset % 2 != 0:
+        raise SyntaxError(f"Branch offset out of range or not word-aligned: {offset}")
+    return ((offset >> 1) & 0xF) * 4096 + rs1 * 64 + $base
+''',
+    # J links nothing; rd is encoded as 0
+    'j': '''\
+    if len(operands) < 1:
+        raise SyntaxError("J instruction requires 1 operand")
+    target = operands[0]
+    if isinstance(target, str):
+        raise SyntaxError(f"Unresolved symbol in jump target: {target}")
+    offset = target - (pc + 2)
+    if offset < -512 or offset > 510 or offset % 2 != 0:
+        raise SyntaxError(f"Jump offset out of range or not word-aligned: {offset}")
+    return ((offset >> 4) & 0x3F) * 512 + ((offset >> 1) & 0x7) * 8 + $base
+''',
+}
+_ENCODER_SOURCE_OVERRIDES['bnz'] = _ENCODER_SOURCE_OVERRIDES['bz']
+
+# The constant part of each class's encoding: (field1, field2) -> the
+# encoding with every operand-dependent field zero
+_ENCODER_BASES = {
+    _ENC_R: lambda funct4, func3: _pack_r_type(funct4, 0, 0, func3),
+    _ENC_I: lambda func3, _: _pack_i_type(0, 0, func3),
+    _ENC_SHIFT: lambda shift_type, _: _pack_i_type(shift_type << 4, 0, 0x3),
+    _ENC_B: lambda func3, _: _pack_b_type(0, 0, 0, func3),
+    _ENC_S: lambda func3, _: _pack_s_type(0, 0, 0, func3),
+    _ENC_L: lambda func3, _: _pack_l_type(0, 0, 0, func3),
+    _ENC_J: lambda link, _: _pack_j_type(link, 0, 0, 0),
+    _ENC_U: lambda flag, _: _pack_u_type(flag, 0, 0, 0),
+    _ENC_SYS: lambda _, __: _pack_sys_type(0, 0),
+    _ENC_SYS_FUNC: lambda func3, _: _pack_sys_type(0, func3),
+    _ENC_SYS_REG: lambda func3, _: _pack_sys_type(0, func3),
+}
+
+# Logical immediates (ORI/ANDI/XORI) are commonly written as unsigned bit
+# masks, so they also accept 0..127; the assembler stores the low 7 bits
+# either way. This is the range LI16's ORI step relies on. The other
+# I-Type immediates (arithmetic/compare/li) are signed: -64..63.
+_LOGICAL_IMMEDIATES = frozenset(('ori', 'andi', 'xori'))
+
+
+def _make_encoder(mnemonic: str, enc_class: int, field1: int, field2: int):
+    """Generate the encoder for one base instruction.
+    
+    Like the packers, the encoder is compiled once from source: the
+    instruction's fields, opcode and error messages become constants, so
+    encoding does no table lookups or per-mnemonic tests.
+    """
+    template = _ENCODER_SOURCE_OVERRIDES.get(mnemonic, _ENCODER_SOURCES[enc_class])
+    if mnemonic in _LOGICAL_IMMEDIATES:
+        low, high = -64, 127
+        range_error = f"{mnemonic.upper()} immediate out of range (expected -64..127): "
+    else:
+        low, high = -64, 63
+        range_error = "I-type immediate out of range: "
+    body = string.Template(template).substitute(
+        name=mnemonic, base=_ENCODER_BASES[enc_class](field1, field2),
+        low=low, high=high, range_error=range_error)
+    name = f"_encode_{mnemonic}"
+    source = f"def {name}(operands, pc):\n{body}"
+    namespace: Dict[str, Any] = {'_register_error': _register_error}
+    exec(compile(source, f"<{name}>", 'exec'), namespace)
+    encoder = namespace[name]
+    encoder.__doc__ = f"Encode {mnemonic.upper()}."
+    return encoder
+
+
+# (encoder, pc_relative) per mnemonic id
+_ENCODE_TABLE = tuple((_make_encoder(mnemonic, cls, field1, field2), cls in _PC_RELATIVE_CLASSES)
+                      for mnemonic, cls, field1, field2 in _INSTRUCTIONS)
+
+# Directives the assembler acts on. The lexer tags DIRECTIVE tokens with
+# the index of their (lowercased) name here, so the assembler dispatches on an
+# int instead of comparing strings; any other directive gets -1 and its
+# line is skipped.
+_DIRECTIVES = ('.org', '.text', '.data', '.bss', '.equ', '.set', '.global',
+               '.byte', '.word', '.string', '.ascii', '.space')
+_DIRECTIVE_ID = {name: i for i, name in enumerate(_DIRECTIVES)}
+
+
+# Register name -> register number (ABI aliases included). Lookups use
+# the lowercased name; membership doubles as the "is a register" test.
+_REGISTER_MAP = {
+    'x0': 0, 'x1': 1, 'x2': 2, 'x3': 3, 'x4': 4, 'x5': 5, 'x6': 6, 'x7': 7,
+    't0': 0, 'ra': 1, 'sp': 2, 's0': 3, 's1': 4, 't1': 5, 'a0': 6, 'a1': 7
+}
+
+
+# Position-independent pseudo-instructions: mnemonic -> (operand count,
+# expansion template). A template is a sequence of (base mnemonic, operand
+# specs); a spec is a constant, or (kind, i) taking operand i as is ('op')
+# or its LUI/ORI part for a 16-bit immediate ('hi9' = bits [15:7],
+# 'lo7' = bits [6:0]). LA is PC-relative and expanded by the parser.
+_SP = _REGISTER_MAP['sp']
+_RA = _REGISTER_MAP['ra']
+_PSEUDO_TEMPLATES = {
+    # LI16 rd, imm16 -> LUI rd, (imm16 >> 7); ORI rd, (imm16 & 0x7F)
+    'li16': (2, (('lui', (('op', 0), ('hi9', 1))), ('ori', (('op', 0), ('lo7', 1))))),
+    # PUSH rs -> ADDI sp, -2; SW rs, 0(sp)
+    'push': (1, (('addi', (_SP, -2)), ('sw', (('op', 0), 0, _SP)))),
+    # POP rd -> LW rd, 0(sp); ADDI sp, 2
+    'pop': (1, (('lw', (('op', 0), 0, _SP)), ('addi', (_SP, 2)))),
+    # CALL label -> JAL ra, label
+    'call': (1, (('jal', (_RA, ('op', 0))),)),
+    # RET -> JR ra, 0 (JR needs 2 operands: rd and rs2, but rs2 is ignored)
+    'ret': (0, (('jr', (_RA, 0)),)),
+    # INC rd -> ADDI rd, 1
+    'inc': (1, (('addi', (('op', 0), 1)),)),
+    # DEC rd -> ADDI rd, -1
+    'dec': (1, (('addi', (('op', 0), -1)),)),
+    # NEG rd -> XORI rd, -1; ADDI rd, 1
+    'neg': (1, (('xori', (('op', 0), -1)), ('addi', (('op', 0), 1)))),
+    # NOT rd -> XORI rd, -1
+    'not': (1, (('xori', (('op', 0), -1)),)),
+    # CLR rd -> XOR rd, rd
+    'clr': (1, (('xor', (('op', 0), ('op', 0))),)),
+    # NOP -> ADD x0, x0
+    'nop': (0, (('add', (0, 0)),)),
+}
+
+# Encoded size in bytes of each pseudo-instruction, 2 per instruction of
+# its expansion; LA (AUIPC+ADDI) is expanded in code, not by template.
+# Sizes must match the actual expansion or labels after a pseudo will be
+# misplaced. Base instructions other than LI are always 2 bytes.
+_PSEUDO_SIZES = {mnemonic: 2 * len(template) for mnemonic, (_, template) in _PSEUDO_TEMPLATES.items()}
+_PSEUDO_SIZES['la'] = 4
+
+
+def _template_operand(spec: Union[int, Tuple[str, int]], operands: Tuple[Union[int, str], ...]) -> Union[int, str]:
+    """Substitute one operand spec of a pseudo-instruction template."""
+    if isinstance(spec, int):
+        return spec
+    kind, index = spec
+    value = operands[index]
+    if kind == 'hi9':
+        return (value >> 7) & 0x1FF
+    if kind == 'lo7':
+        return value & 0x7F
+    return value
+
+
+@functools.lru_cache(maxsize=4096)
+def _expand_pseudo(mnemonic: str, operands: Tuple[Union[int, str], ...]) -> Tuple[Tuple[str, Tuple[Union[int, str], ...]], ...]:
+    """Expand a position-independent pseudo-instruction into base instructions.
+    
+    Pure in its arguments, so repeated pseudo-instructions (nop, ret,
+    push/pop of the same register, ...) reuse one cached expansion.
+    """
+    entry = _PSEUDO_TEMPLATES.get(mnemonic)
+    if entry is None:
+        return ()
+    arity, template = entry
+    if len(operands) != arity:
+        raise SyntaxError(f"{mnemonic.upper()} requires {arity} operand{'' if arity == 1 else 's'}")
+    return tuple((base, tuple(_template_operand(spec, operands) for spec in specs))
+                 for base, specs in template)
+
+
 class ZX16Lexer:
     """Lexical analyzer for ZX16 assembly language."""
     
+    # Master scanner: one alternation over every token form, so the regex
+    # engine walks the source and Python only sees one match per token.
+    _SCANNER = re.compile(r"""
+          (?P<WS>[ \t\r]+)
+        | (?P<NEWLINE>\n)
+        | (?P<COMMENT>\#[^\n]*|/\*.*?(?:\*/|\Z))
+        | (?P<PUNCT>[,:()])
+        | (?P<STRING>"(?P<string_body>(?:\\.|[^"\\])*)"?)
+        | (?P<CHAR>'(?P<char_body>\\.|.)'?)
+        | (?P<HEX>-?0[xX][0-9a-fA-F]+)
+        | (?P<BIN>-?0[bB][01]+)
+        | (?P<OCT>-?0[oO][0-7]+)
+        | (?P<NUM>-?\d+)
+        | (?P<DIRECTIVE>\.\w*)
+        | (?P<LABEL>(?P<label_name>[^\W\d]\w*)[ \t\r]*:)
+        | (?P<IDENT>[^\W\d]\w*)
+        """, re.VERBOSE | re.DOTALL)
+    
+    _NUMBER_BASES = {'HEX': 16, 'BIN': 2, 'OCT': 8, 'NUM': 10}
+    
+    _PUNCT_TOKENS = {
+        ',': TokenType.COMMA,
+        ':': TokenType.COLON,
+        '(': TokenType.LPAREN,
+        ')': TokenType.RPAREN
+    }
+    
     def __init__(self, text: str, filename: str = "<input>"):
         self.text = text
         self.filename = filename
-        self.pos = 0
-        self.line = 1
-        self.column = 1
         self.tokens: List[Token] = []
+        # Offsets of every newline, behind a -1 sentinel: line N starts
+        # just after self._newlines[N - 1]
+        self._newlines = array.array('i', [-1])
+        self._newlines.extend(m.start() for m in re.finditer(r'\n', text))
     
-    def current_char(self) -> str:
-        """Get the current character."""
-        if self.pos >= len(self.text):
-            return ''
-        return self.text[self.pos]
+    def position(self, pos: int, hint: int = 1) -> Tuple[int, int]:
+        """Get the (line, column) of a text offset, both 1-based.
+        
+        hint is a line known not to be after pos; it narrows the search.
+        """
+        line = bisect.bisect_left(self._newlines, pos, hint)
+        return line, pos - self._newlines[line - 1]
     
-    def peek_char(self, offset: int = 1) -> str:
-        """Peek at character with offset."""
-        peek_pos = self.pos + offset
-        if peek_pos >= len(self.text):
-            return ''
-        return self.text[peek_pos]
+    # Escapes with a special meaning; any other escaped character
+    # (\\, \", \', ...) stands for itself
+    _ESCAPES = {'n': '\n', 't': '\t', 'r': '\r'}
+    _ESCAPE_SEQUENCE = re.compile(r'\\(.)', re.DOTALL)
+    # Escapes unicode_escape would read differently from us (\0, \x41, \a...
+    # are taken literally here); bodies with none can use the codec
+    _FOREIGN_ESCAPE = re.compile(r'\\[^ntr\\"\']', re.DOTALL)
     
-    def advance(self) -> None:
-        """Advance to the next character."""
-        if self.pos < len(self.text) and self.text[self.pos] == '\n':
-            self.line += 1
-            self.column = 1
-        else:
-            self.column += 1
-        self.pos += 1
-    
-    def skip_whitespace(self) -> None:
-        """Skip whitespace except newlines."""
-        while self.current_char() in ' \t\r':
-            self.advance()
-    
-    def read_string(self) -> str:
-        """Read a string literal."""
-        result = ''
-        self.advance()  # Skip opening quote
-        
-        while self.current_char() and self.current_char() != '"':
-            if self.current_char() == '\\':
-                self.advance()
-                escape_char = self.current_char()
-                escape_map = {
-                    'n': '\n', 't': '\t', 'r': '\r', 
-                    '\\': '\\', '"': '"'
-                }
-                result += escape_map.get(escape_char, escape_char)
-            else:
-                result += self.current_char()
-            self.advance()
-        
-        if self.current_char() == '"':
-            self.advance()  # Skip closing quote
-        
-        return result
+    @classmethod
+    def _unescape(cls, match: 're.Match') -> str:
+        char = match.group(1)
+        return cls._ESCAPES.get(char, char)
     
-    def read_number(self) -> int:
-        """Read a numeric literal."""
-        start_pos = self.pos
-        
-        # Handle different number bases
-        if self.current_char() == '0' and self.peek_char():
-            self.advance()
-            if self.current_char().lower() == 'x':
-                # Hexadecimal
-                self.advance()
-                while self.current_char().lower() in '0123456789abcdef':
-                    self.advance()
-                return int(self.text[start_pos:self.pos], 16)
-            elif self.current_char().lower() == 'b':
-                # Binary
-                self.advance()
-                while self.current_char() in '01':
-                    self.advance()
-                return int(self.text[start_pos:self.pos], 2)
-            elif self.current_char().lower() == 'o':
-                # Octal
-                self.advance()
-                while self.current_char() in '01234567':
-                    self.advance()
-                return int(self.text[start_pos:self.pos], 8)
-            else:
-                # Decimal starting with 0
-                self.pos = start_pos
-        
-        # Decimal number
-        while self.current_char().isdigit():
-            self.advance()
-        
-        return int(self.text[start_pos:self.pos])
+    @classmethod
+    def decode_string(cls, body: str) -> str:
+        """Resolve backslash escapes in the body of a string literal."""
+        if '\\' not in body:
+            return body
+        if body.isascii() and not cls._FOREIGN_ESCAPE.search(body):
+            return codecs.decode(body, 'unicode_escape')
+        return cls._ESCAPE_SEQUENCE.sub(cls._unescape, body)
     
-    def read_identifier(self) -> str:
-        """Read an identifier."""
-        start_pos = self.pos
-        
-        while (self.current_char().isalnum() or 
-               self.current_char() in '_'):
-            self.advance()
-        
-        return self.text[start_pos:self.pos]
+    @classmethod
+    def decode_char(cls, body: str) -> int:
+        """Get the value of the body of a character literal."""
+        if body[0] == '\\':
+            return ord(cls._ESCAPES.get(body[1], body[1]))
+        return ord(body)
     
     def is_register(self, identifier: str) -> bool:
         """Check if identifier is a register name."""
-        register_names = {
-            'x0', 'x1', 'x2', 'x3', 'x4', 'x5', 'x6', 'x7',
-            't0', 'ra', 'sp', 's0', 's1', 't1', 'a0', 'a1'
-        }
-        return identifier.lower() in register_names
+        return identifier.lower() in _REGISTER_MAP
     
     def tokenize(self) -> List[Token]:
         """Tokenize the input text."""
-        while self.pos < len(self.text):
-            self.skip_whitespace()
-            
-            if not self.current_char():
-                break
-            
-            line, column = self.line, self.column
-            
-            # Handle newlines
-            if self.current_char() == '\n':
-                self.tokens.append(Token(TokenType.NEWLINE, '\n', line, column))
-                self.advance()
+        text = self.text
+        end = len(text)
+        match = self._SCANNER.match
+        tokens = self.tokens
+        pos = 0
+        line = 1
+        
+        while pos < end:
+            m = match(text, pos)
+            if m is None:
+                # Unknown character - skip it
+                pos += 1
                 continue
             
-            # Handle comments
-            if self.current_char() == '#':
-                start_pos = self.pos
-                while self.current_char() and self.current_char() != '\n':
-                    self.advance()
-                comment_text = self.text[start_pos:self.pos]
-                self.tokens.append(Token(TokenType.COMMENT, comment_text, line, column))
+            kind = m.lastgroup
+            start, pos = m.span()
+            if kind == 'WS':
                 continue
             
-            # Handle block comments
-            if self.current_char() == '/' and self.peek_char() == '*':
-                start_pos = self.pos
-                self.advance()  # Skip '/'
-                self.advance()  # Skip '*'
-                while self.pos < len(self.text) - 1:
-                    if self.current_char() == '*' and self.peek_char() == '/':
-                        self.advance()  # Skip '*'
-                        self.advance()  # Skip '/'
-                        break
-                    self.advance()
-                comment_text = self.text[start_pos:self.pos]
-                self.tokens.append(Token(TokenType.COMMENT, comment_text, line, column))
-                continue
+            # Tokens arrive in source order, so the last line is a valid hint
+            line, column = self.position(start, line)
+            value = m.group()
             
-            # Handle single character tokens
-            char_tokens = {
-                ',': TokenType.COMMA,
-                ':': TokenType.COLON,
-                '(': TokenType.LPAREN,
-                ')': TokenType.RPAREN
-            }
+            # Handle identifiers, instructions, and registers
+            if kind == 'IDENT':
+                lowered = value.lower()
+                reg_num = _REGISTER_MAP.get(lowered)
+                if reg_num is not None:
+                    tokens.append(Token(TokenType.REGISTER, value, line, column, reg_num))
+                else:
+                    # Assume it's an instruction or symbol
+                    tokens.append(Token(TokenType.INSTRUCTION, value, line, column,
+                                        _MNEMONIC_ID.get(lowered, -1)))
             
-            if self.current_char() in char_tokens:
-                token_type = char_tokens[self.current_char()]
-                self.tokens.append(Token(token_type, self.current_char(), line, column))
-                self.advance()
-                continue
+            elif kind == 'LABEL':
+                # Identifier followed by ':' (the colon is part of the match)
+                tokens.append(Token(TokenType.LABEL, m.group('label_name'), line, column))
             
-            # Handle string literals
-            if self.current_char() == '"':
-                string_value = self.read_string()
-                self.tokens.append(Token(TokenType.STRING, string_value, line, column))
-                continue
+            elif kind == 'PUNCT':
+                tokens.append(Token(self._PUNCT_TOKENS[value], value, line, column))
             
-            # Handle character literals
-            if self.current_char() == "'":
-                self.advance()  # Skip opening quote
-                char_value = 0
-                if self.current_char() == '\\':
-                    self.advance()
-                    escape_char = self.current_char()
-                    escape_map = {
-                        'n': ord('\n'), 't': ord('\t'), 'r': ord('\r'),
-                        '\\': ord('\\'), "'": ord("'")
-                    }
-                    char_value = escape_map.get(escape_char, ord(escape_char))
-                    self.advance()
-                else:
-                    char_value = ord(self.current_char())
-                    self.advance()
-                
-                if self.current_char() == "'":
-                    self.advance()  # Skip closing quote
-                
-                self.tokens.append(Token(TokenType.CHARACTER, str(char_value), line, column))
-                continue
+            elif kind == 'NEWLINE':
+                tokens.append(Token(TokenType.NEWLINE, value, line, column))
             
-            # Handle negative numbers
-            if self.current_char() == '-' and self.peek_char().isdigit():
-                self.advance()  # Skip '-'
-                number_value = -self.read_number()
-                self.tokens.append(Token(TokenType.IMMEDIATE, str(number_value), line, column))
-                continue
+            elif kind in self._NUMBER_BASES:
+                number_value = int(value, self._NUMBER_BASES[kind])
+                tokens.append(Token(TokenType.IMMEDIATE, str(number_value), line, column,
+                                    number_value))
             
-            # Handle numbers
-            if self.current_char().isdigit():
-                number_value = self.read_number()
-                self.tokens.append(Token(TokenType.IMMEDIATE, str(number_value), line, column))
-                continue
+            elif kind == 'COMMENT':
+                tokens.append(Token(TokenType.COMMENT, value, line, column))
             
-            # Handle directives
-            if self.current_char() == '.':
-                start_pos = self.pos
-                self.advance()  # Skip '.'
-                identifier = self.read_identifier()
-                directive_name = self.text[start_pos:self.pos]
-                self.tokens.append(Token(TokenType.DIRECTIVE, directive_name, line, column))
-                continue
+            elif kind == 'DIRECTIVE':
+                tokens.append(Token(TokenType.DIRECTIVE, value, line, column,
+                                    _DIRECTIVE_ID.get(value.lower(), -1)))
             
-            # Handle identifiers, labels, instructions, and registers
-            if self.current_char().isalpha() or self.current_char() == '_':
-                identifier = self.read_identifier()
-                
-                # Check if it's followed by a colon (label)
-                old_pos = self.pos
-                self.skip_whitespace()
-                if self.current_char() == ':':
-                    self.advance()  # Consume the colon
-                    self.tokens.append(Token(TokenType.LABEL, identifier, line, column))
-                    continue
-                else:
-                    self.pos = old_pos  # Restore position
-                
-                # Check if it's a register
-                if self.is_register(identifier):
-                    self.tokens.append(Token(TokenType.REGISTER, identifier, line, column))
-                else:
-                    # Assume it's an instruction or symbol
-                    self.tokens.append(Token(TokenType.INSTRUCTION, identifier, line, column))
-                continue
+            elif kind == 'STRING':
+                string_value = self.decode_string(m.group('string_body'))
+                tokens.append(Token(TokenType.STRING, string_value, line, column))
             
-            # Unknown character - skip it
-            self.advance()
+            elif kind == 'CHAR':
+                char_value = self.decode_char(m.group('char_body'))
+                tokens.append(Token(TokenType.CHARACTER, str(char_value), line, column, char_value))
         
-        self.tokens.append(Token(TokenType.EOF, '', self.line, self.column))
-        return self.tokens
+        line, column = self.position(end, line)
+        tokens.append(Token(TokenType.EOF, '', line, column))
+        return tokens
 
 
 class ZX16Parser:
@@ -353,41 +752,20 @@ class ZX16Parser:
         self.pos = 0
         self.current_token = self.tokens[0] if tokens else Token(TokenType.EOF, '', 1, 1)
         
-        # Instruction encoding tables
-        self.r_type_instructions = {
-            'add': (0x0, 0x0), 'sub': (0x1, 0x0), 'slt': (0x2, 0x1), 'sltu': (0x3, 0x2),
-            'sll': (0x4, 0x3), 'srl': (0x5, 0x3), 'sra': (0x6, 0x3), 'or': (0x7, 0x4),
-            'and': (0x8, 0x5), 'xor': (0x9, 0x6), 'mv': (0xa, 0x7), 'jr': (0xb, 0x0),
-            'jalr': (0xc, 0x0)
-        }
-        
-        self.i_type_instructions = {
-            'addi': 0x0, 'slti': 0x1, 'sltui': 0x2, 'ori': 0x4,
-            'andi': 0x5, 'xori': 0x6, 'li': 0x7  # LI is a real I-Type instruction
-        }
+        # Instruction encoding tables (per-format views of _INSTRUCTIONS)
+        def fields(enc_class):
+            return {name: (f1, f2) if enc_class == _ENC_R else f1
+                    for name, cls, f1, f2 in _INSTRUCTIONS if cls == enc_class}
         
-        self.shift_instructions = {
-            'slli': 0x1, 'srli': 0x2, 'srai': 0x4
-        }
-        
-        self.b_type_instructions = {
-            'beq': 0x0, 'bne': 0x1, 'bz': 0x2, 'bnz': 0x3,
-            'blt': 0x4, 'bge': 0x5, 'bltu': 0x6, 'bgeu': 0x7
-        }
-        
-        self.s_type_instructions = {
-            'sb': 0x0, 'sw': 0x1
-        }
-        
-        self.l_type_instructions = {
-            'lb': 0x0, 'lw': 0x1, 'lbu': 0x4
-        }
+        self.r_type_instructions = fields(_ENC_R)
+        self.i_type_instructions = fields(_ENC_I)
+        self.shift_instructions = fields(_ENC_SHIFT)
+        self.b_type_instructions = fields(_ENC_B)
+        self.s_type_instructions = fields(_ENC_S)
+        self.l_type_instructions = fields(_ENC_L)
         
         # Register name mapping
-        self.register_map = {
-            'x0': 0, 'x1': 1, 'x2': 2, 'x3': 3, 'x4': 4, 'x5': 5, 'x6': 6, 'x7': 7,
-            't0': 0, 'ra': 1, 'sp': 2, 's0': 3, 's1': 4, 't1': 5, 'a0': 6, 'a1': 7
-        }
+        self.register_map = _REGISTER_MAP
         
         # Pseudo-instruction expansions (LI removed - it's handled specially)
         self.pseudo_instructions = {
@@ -401,41 +779,57 @@ class ZX16Parser:
             self.pos += 1
             self.current_token = self.tokens[self.pos]
     
+    def take_list(self, types: Sequence[TokenType]) -> List[Token]:
+        """Consume a comma-separated list of tokens of the given types.
+        
+        Equivalent to advancing over each element and its comma, but done
+        in one scan of the token array. Stops after an element that is not
+        followed by a comma, or at the first token that is not an element.
+        Returns the element tokens consumed.
+        """
+        if self.current_token.type not in types:
+            return []
+        tokens = self.tokens
+        last = len(tokens) - 1
+        pos = self.pos
+        elements = []
+        while pos < last and tokens[pos].type in types:
+            elements.append(tokens[pos])
+            pos += 1
+            if tokens[pos].type != TokenType.COMMA:
+                break
+            if pos < last:
+                pos += 1
+        else:
+            if pos == last and tokens[pos].type in types:
+                elements.append(tokens[pos])  # element is the very last token
+        self.pos = pos
+        self.current_token = tokens[pos]
+        return elements
+    
     def sign_extend(self, value: Union[int, str], bits: int) -> Union[int, str]:
         """Sign extend a value to specified bits."""
         if isinstance(value, str):
             return value  # Symbol, will be resolved later
-        
-        sign_bit = 1 << (bits - 1)
-        mask = (1 << bits) - 1
-        
-        if value & sign_bit:
-            return value | (~mask)
-        return value & mask
+        return _sign_extend(value, bits)
     
-    def expand_pseudo_instruction(self, mnemonic: str, operands: List[Union[int, str]], current_pc: int = 0, symbol_resolver=None) -> List[Tuple[str, List[Union[int, str]]]]:
-        """Expand pseudo-instructions into base instructions."""
+    def expand_pseudo_instruction(self, mnemonic: str, operands: List[Union[int, str]], current_pc: int = 0, symbol_resolver=None) -> Sequence[Tuple[str, Sequence[Union[int, str]]]]:
+        """Expand pseudo-instructions into base instructions.
+        
+        LA is PC-relative and is expanded here; every other expansion depends
+        only on the mnemonic and operands and comes from the memoized
+        _expand_pseudo. The result must not be modified by the caller.
+        """
         expansions = []
         
         if mnemonic == 'li16':
-            # LI16 rd, imm16 -> LUI rd, (imm16 >> 7); ORI rd, (imm16 & 0x7F)
-            if len(operands) != 2:
-                raise SyntaxError("LI16 requires 2 operands")
-            rd, imm16 = operands
-            
-            if isinstance(imm16, str):
+            if len(operands) == 2 and isinstance(operands[1], str):
                 # Symbol reference - try to resolve it
                 if symbol_resolver:
-                    imm16 = symbol_resolver(imm16)
+                    operands = [operands[0], symbol_resolver(operands[1])]
                 else:
                     # Defer expansion
                     return [(mnemonic, operands)]
-            
-            upper = (imm16 >> 7) & 0x1FF
-            lower = imm16 & 0x7F
-            
-            expansions.append(('lui', [rd, upper]))
-            expansions.append(('ori', [rd, lower]))
         
         elif mnemonic == 'la':
             # LA rd, label -> AUIPC rd, high; ADDI rd, rd, low (PC-relative)
@@ -479,92 +873,10 @@ class ZX16Parser:
 
                 expansions.append(('auipc', [rd, high]))
                 expansions.append(('addi', [rd, low]))
-
-        elif mnemonic == 'push':
-            # PUSH rs -> ADDI sp, -2; SW rs, 0(sp)
-            if len(operands) != 1:
-                raise SyntaxError("PUSH requires 1 operand")
-            
-            rs = operands[0]
-            sp = self.register_map['sp']
-            expansions.append(('addi', [sp, -2]))
-            expansions.append(('sw', [rs, 0, sp]))
-        elif mnemonic == 'pop':
-            # POP rd -> LW rd, 0(sp); ADDI sp, 2
-            if len(operands) != 1:
-                raise SyntaxError("POP requires 1 operand")
-            rd = operands[0]
-            sp = self.register_map['sp']
-            
-            expansions.append(('lw', [rd, 0, sp]))
-            expansions.append(('addi', [sp, 2]))
-        
-        elif mnemonic == 'call':
-            # CALL label -> JAL ra, label
-            if len(operands) != 1:
-                raise SyntaxError("CALL requires 1 operand")
-            label = operands[0]
-            ra = self.register_map['ra']
-            
-            expansions.append(('jal', [ra, label]))
-        
-        elif mnemonic == 'ret':
-            # RET -> JR ra, 0 (JR needs 2 operands: rd and rs2, but rs2 is ignored)
-            if len(operands) != 0:
-                raise SyntaxError("RET requires 0 operands")
-            ra = self.register_map['ra']
-            
-            expansions.append(('jr', [ra, 0]))  # JR ra with dummy rs2
-        
-        elif mnemonic == 'inc':
-            # INC rd -> ADDI rd, 1
-            if len(operands) != 1:
-                raise SyntaxError("INC requires 1 operand")
-            rd = operands[0]
-            
-            expansions.append(('addi', [rd, 1]))
-        
-        elif mnemonic == 'dec':
-            # DEC rd -> ADDI rd, -1
-            if len(operands) != 1:
-                raise SyntaxError("DEC requires 1 operand")
-            rd = operands[0]
             
-            expansions.append(('addi', [rd, -1]))
+            return expansions
         
-        elif mnemonic == 'neg':
-            # NEG rd -> XORI rd, -1; ADDI rd, 1
-            if len(operands) != 1:
-                raise SyntaxError("NEG requires 1 operand")
-            rd = operands[0]
-            
-            expansions.append(('xori', [rd, -1]))
-            expansions.append(('addi', [rd, 1]))
-        
-        elif mnemonic == 'not':
-            # NOT rd -> XORI rd, -1
-            if len(operands) != 1:
-                raise SyntaxError("NOT requires 1 operand")
-            rd = operands[0]
-            
-            expansions.append(('xori', [rd, -1]))
-        
-        elif mnemonic == 'clr':
-            # CLR rd -> XOR rd, rd
-            if len(operands) != 1:
-                raise SyntaxError("CLR requires 1 operand")
-            rd = operands[0]
-            
-            expansions.append(('xor', [rd, rd]))
-        
-        elif mnemonic == 'nop':
-            # NOP -> ADD x0, x0
-            if len(operands) != 0:
-                raise SyntaxError("NOP requires 0 operands")
-            
-            expansions.append(('add', [0, 0]))
-        
-        return expansions
+        return _expand_pseudo(mnemonic, tuple(operands))
 
 
 class ZX16Assembler:
@@ -572,6 +884,7 @@ class ZX16Assembler:
     
     def __init__(self):
         self.symbols: Dict[str, Symbol] = {}
+        self._symbol_values: Dict[str, int] = {}  # defined symbols only: name -> value
         self.instructions: List[Instruction] = []
         self.errors: List[AssemblyError] = []
         self.warnings: List[AssemblyError] = []
@@ -579,10 +892,27 @@ class ZX16Assembler:
         self.current_section = '.text'
         self.output_format = OutputFormat.BINARY
         self.verbose = False
+        self.peephole = True  # LI of a value with bits [6:0] clear -> LUI alone
         
         # Built-in symbols
         self.init_builtin_symbols()
         
+        # (mnemonic id, *operands) -> encoding, for PC-independent instructions
+        self._encoding_cache: Dict[Tuple[Union[int, str], ...], int] = {}
+        
+        # Directive handlers, keyed by directive id (see _DIRECTIVES)
+        handlers = {
+            '.org': self._dir_org,
+            '.text': self._dir_section, '.data': self._dir_section, '.bss': self._dir_section,
+            '.equ': self._dir_equ, '.set': self._dir_equ,
+            '.global': self._dir_global,
+            '.byte': self._dir_byte,
+            '.word': self._dir_word,
+            '.string': self._dir_string, '.ascii': self._dir_string,
+            '.space': self._dir_space,
+        }
+        self._directive_handlers = {_DIRECTIVE_ID[name]: handler for name, handler in handlers.items()}
+        
         # Data sections
         self.sections = {
             '.text': bytearray(),
@@ -611,10 +941,15 @@ class ZX16Assembler:
         
         for name, value in builtins.items():
             self.symbols[name] = Symbol(name, value, defined=True, global_symbol=True)
+            self._symbol_values[name] = value
     
-    def add_error(self, message: str, line: int, column: int = 0, severity: str = "Error") -> None:
-        """Add an error to the error list."""
-        error = AssemblyError(message, line, column, severity)
+    def add_error(self, code: str, line: int, *args: Any, column: int = 0,
+                  severity: str = "Error") -> None:
+        """Add an error to the error list.
+        
+        code is a key of _ERROR_FORMATS; args fill in its message.
+        """
+        error = AssemblyError(code, line, column, severity, args)
         if severity == "Error":
             self.errors.append(error)
         elif severity == "Warning":
@@ -622,24 +957,28 @@ class ZX16Assembler:
     
     def resolve_symbol(self, name: str, line: int = 0) -> int:
         """Resolve a symbol to its value."""
+        value = self._symbol_values.get(name)
+        if value is not None:
+            return value
         if name in self.symbols:
             symbol = self.symbols[name]
             if not symbol.defined:
-                self.add_error(f"Undefined symbol '{name}'", line)
+                self.add_error('undefined_symbol', line, name)
                 return 0
             return symbol.value
         else:
-            self.add_error(f"Unknown symbol '{name}'", line)
+            self.add_error('unknown_symbol', line, name)
             return 0
     
     def define_symbol(self, name: str, value: int, line: int = 0, global_sym: bool = False) -> None:
         """Define a symbol."""
         if name in self.symbols:
             if self.symbols[name].defined:
-                self.add_error(f"Symbol '{name}' already defined", line)
+                self.add_error('duplicate_symbol', line, name)
                 return
         
         self.symbols[name] = Symbol(name, value, defined=True, global_symbol=global_sym, line=line)
+        self._symbol_values[name] = value
     
     def assemble(self, source_code: str, filename: str = "<input>") -> bool:
         """Assemble source code."""
@@ -651,35 +990,67 @@ class ZX16Assembler:
             if self.verbose:
                 print(f"Tokenized {len(tokens)} tokens")
             
-            # Pass 1: Symbol collection
-            self.pass1(tokens, filename)
-            
-            if self.errors:
-                return False
+            # Symbol collection and code generation, forward references fixed up
+            self.assemble_single(tokens, filename)
             
             if self.verbose:
-                print(f"Pass 1 complete. Found {len(self.symbols)} symbols")
-            
-            # Pass 2: Code generation
-            self.pass2(tokens, filename)
-            
-            if self.verbose:
-                print(f"Pass 2 complete. Generated {len(self.sections['.text'])} bytes of code")
+                print(f"Assembly pass complete. Found {len(self.symbols)} symbols, "
+                      f"generated {len(self.sections['.text'])} bytes of code")
             
             return len(self.errors) == 0
         
         except Exception as e:
-            self.add_error(f"Internal assembler error: {str(e)}", 0)
+            self.add_error('internal', 0, e)
             return False
     
-    def pass1(self, tokens: List[Token], filename: str = "<input>") -> None:
-        """First pass: collect symbols and calculate addresses."""
+    @classmethod
+    def assemble_files(cls, paths: Sequence[str], max_workers: Optional[int] = None,
+                       verbose: bool = False, peephole: bool = True) -> List['ZX16Assembler']:
+        """Assemble several independent source files in parallel.
+        
+        Each file is assembled by its own assembler in a worker process
+        (one per CPU by default), configured with verbose and peephole as
+        the attributes of the same name. Returns one assembler per path, in order,
+        holding that file's symbols, sections and diagnostics; a file
+        succeeded if its assembler has no errors. Files are not linked:
+        every program is placed at its own absolute addresses.
+        """
+        if len(paths) <= 1 or max_workers == 1:
+            results = [_assemble_file(path, verbose, peephole) for path in paths]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(_assemble_file, paths, [verbose] * len(paths),
+                                        [peephole] * len(paths)))
+        
+        assemblers = []
+        for state in results:
+            assembler = cls()
+            assembler.verbose = verbose
+            assembler.peephole = peephole
+            for name in _ASSEMBLY_STATE:
+                setattr(assembler, name, state[name])
+            assemblers.append(assembler)
+        return assemblers
+    
+    def assemble_single(self, tokens: List[Token], filename: str = "<input>") -> None:
+        """Assemble a token stream in one pass.
+        
+        Labels are defined and code and data emitted as they are met. An
+        instruction with an operand naming a symbol that is not defined yet
+        (a forward reference) gets zero bytes of its final size reserved and
+        a fixup recorded; once the whole stream is read, each fixup is
+        encoded with its symbols resolved and patched into place.
+        """
         parser = ZX16Parser(tokens, filename)
-        self.current_address = self.section_addresses[self.current_section]
+        self.current_section = '.text'
+        self.current_address = self.section_addresses['.text']
+        section_data = self.sections['.text']
+        symbol_values = self._symbol_values
+        fixups = []     # (section data, offset, address, mnemonic, mnemonic id, operands, size, line)
         
         while parser.current_token.type != TokenType.EOF:
             # Skip comments and newlines
-            if parser.current_token.type in [TokenType.COMMENT, TokenType.NEWLINE]:
+            if parser.current_token.type in _SKIPPED_TOKENS:
                 parser.advance()
                 continue
             
@@ -694,304 +1065,67 @@ class ZX16Assembler:
             
             # Handle directives
             if parser.current_token.type == TokenType.DIRECTIVE:
-                directive = parser.current_token.value.lower()
+                code = parser.current_token.code
                 parser.advance()
                 
-                if directive == '.org':
-                    if parser.current_token.type == TokenType.IMMEDIATE:
-                        org = int(parser.current_token.value)
-                        # If nothing has been emitted in this section yet, .org sets
-                        # the section's origin; otherwise it's a forward skip.
-                        if self.current_address == self.section_addresses[self.current_section]:
-                            self.section_addresses[self.current_section] = org
-                        self.current_address = org
-                        parser.advance()
-                    else:
-                        self.add_error("Expected address after .org", line)
-                
-                elif directive == '.text':
-                    self.current_section = '.text'
-                    self.current_address = self.section_addresses['.text']
-                
-                elif directive == '.data':
-                    self.current_section = '.data'
-                    self.current_address = self.section_addresses['.data']
-                
-                elif directive == '.bss':
-                    self.current_section = '.bss'
-                    self.current_address = self.section_addresses['.bss']
-                
-                elif directive in ['.equ', '.set']:
-                    if parser.current_token.type == TokenType.INSTRUCTION:
-                        symbol_name = parser.current_token.value
-                        parser.advance()
-                        if parser.current_token.type == TokenType.COMMA:
-                            parser.advance()
-                        if parser.current_token.type == TokenType.IMMEDIATE:
-                            value = int(parser.current_token.value)
-                            self.define_symbol(symbol_name, value, line)
-                            parser.advance()
-                        elif parser.current_token.type == TokenType.INSTRUCTION:
-                            # Symbol reference
-                            ref_symbol = parser.current_token.value
-                            if ref_symbol in self.symbols:
-                                value = self.symbols[ref_symbol].value
-                                self.define_symbol(symbol_name, value, line)
-                            else:
-                                self.add_error(f"Undefined symbol '{ref_symbol}' in .equ", line)
-                            parser.advance()
-                        else:
-                            self.add_error("Expected value after symbol name", line)
-                    else:
-                        self.add_error(f"Expected symbol name after {directive}", line)
-                
-                elif directive == '.global':
-                    if parser.current_token.type == TokenType.INSTRUCTION:
-                        symbol_name = parser.current_token.value
-                        if symbol_name in self.symbols:
-                            self.symbols[symbol_name].global_symbol = True
-                        parser.advance()
-                    else:
-                        self.add_error("Expected symbol name after .global", line)
+                handler = self._directive_handlers.get(code)
+                if handler:
+                    handler(parser, _DIRECTIVES[code], line)
+                    section_data = self.sections[self.current_section]
                 
-                elif directive in ['.byte', '.word', '.string', '.ascii', '.space']:
-                    # Calculate space for data directives
-                    if directive == '.byte':
-                        while parser.current_token.type in [TokenType.IMMEDIATE, TokenType.CHARACTER]:
-                            self.current_address += 1
-                            parser.advance()
-                            if parser.current_token.type == TokenType.COMMA:
-                                parser.advance()
-                            else:
-                                break
-                    
-                    elif directive == '.word':
-                        while parser.current_token.type == TokenType.IMMEDIATE:
-                            self.current_address += 2
-                            parser.advance()
-                            if parser.current_token.type == TokenType.COMMA:
-                                parser.advance()
-                            else:
-                                break
-                    
-                    elif directive in ['.string', '.ascii']:
-                        if parser.current_token.type == TokenType.STRING:
-                            string_len = len(parser.current_token.value)
-                            if directive == '.string':
-                                string_len += 1  # Null terminator
-                            self.current_address += string_len
-                            parser.advance()
-                        else:
-                            self.add_error(f"Expected string after {directive}", line)
-                    
-                    elif directive == '.space':
-                        if parser.current_token.type == TokenType.IMMEDIATE:
-                            space_size = int(parser.current_token.value)
-                            self.current_address += space_size
-                            parser.advance()
-                        else:
-                            self.add_error("Expected size after .space", line)
-                
-                # Skip to end of line for other directives
-                while (parser.current_token.type not in [TokenType.NEWLINE, TokenType.EOF]):
+                # Skip the rest of the line (unknown directives are ignored)
+                while parser.current_token.type not in _END_OF_LINE:
                     parser.advance()
                 continue
             
             # Handle instructions (including special LI handling)
             if parser.current_token.type == TokenType.INSTRUCTION:
-                mnemonic = parser.current_token.value.lower()
-                parser.advance()
-                
-                # Skip operands for pass 1 (just count instruction size)
-                operand_count = 0
-                has_immediate = False
-                immediate_value = 0
-                
-                # Quick parse to check LI immediate size
-                if mnemonic == 'li':
-                    # Look for the immediate operand
-                    temp_pos = parser.pos
-                    while (parser.current_token.type not in [TokenType.NEWLINE, TokenType.EOF, TokenType.COMMENT]):
-                        if parser.current_token.type == TokenType.COMMA:
-                            parser.advance()
-                        elif parser.current_token.type in [TokenType.IMMEDIATE, TokenType.CHARACTER]:
-                            immediate_value = int(parser.current_token.value)
-                            has_immediate = True
-                            parser.advance()
-                        else:
-                            parser.advance()
-                    parser.pos = temp_pos  # Restore position
-                
-                # Skip all operands
-                while (parser.current_token.type not in [TokenType.NEWLINE, TokenType.EOF, TokenType.COMMENT]):
-                    parser.advance()
-                
-                # Calculate instruction size
-                if mnemonic == 'li' and has_immediate:
-                    # LI: if immediate fits in 7 bits, it's I-Type (2 bytes)
-                    # Otherwise, it's pseudo (expands to LI16 - 4 bytes)
-                    if -64 <= immediate_value <= 63:
-                        self.current_address += 2  # Real LI instruction
-                    else:
-                        self.current_address += 4  # Expands to LI16 (LUI + ORI)
-                elif mnemonic in parser.pseudo_instructions:
-                    # Size must match the actual expansion in
-                    # expand_pseudo_instruction(), or labels after a pseudo
-                    # will be misplaced.
-                    #   li16, la, push, pop, neg  -> 2 instructions (4 bytes)
-                    #   call, ret, inc, dec, not, clr, nop -> 1 instruction (2 bytes)
-                    if mnemonic in ['li16', 'la', 'push', 'pop', 'neg']:
-                        self.current_address += 4  # Expands to 2 instructions
-                    else:
-                        self.current_address += 2  # Expands to 1 instruction
+                # Base mnemonics come canonicalized by their id; only pseudo and
+                # unknown mnemonics need lowercasing
+                mnemonic_id = parser.current_token.code
+                if mnemonic_id >= 0:
+                    mnemonic = _MNEMONIC_NAMES[mnemonic_id]
                 else:
-                    self.current_address += 2  # Regular instruction
-                
-                continue
-            
-            # Skip unknown tokens
-            parser.advance()
-    
-    def pass2(self, tokens: List[Token], filename: str = "<input>") -> None:
-        """Second pass: generate machine code."""
-        parser = ZX16Parser(tokens, filename)
-        self.current_address = self.section_addresses[self.current_section]
-        current_section_data = self.sections[self.current_section]
-        
-        while parser.current_token.type != TokenType.EOF:
-            # Skip comments and newlines
-            if parser.current_token.type in [TokenType.COMMENT, TokenType.NEWLINE]:
-                parser.advance()
-                continue
-            
-            line = parser.current_token.line
-            
-            # Handle labels (already processed in pass 1)
-            if parser.current_token.type == TokenType.LABEL:
-                parser.advance()
-                continue
-            
-            # Handle directives
-            if parser.current_token.type == TokenType.DIRECTIVE:
-                directive = parser.current_token.value.lower()
+                    mnemonic = parser.current_token.value.lower()
                 parser.advance()
                 
-                if directive == '.org':
-                    if parser.current_token.type == TokenType.IMMEDIATE:
-                        org = int(parser.current_token.value)
-                        base = self.section_addresses[self.current_section]
-                        if len(current_section_data) == 0:
-                            self.section_addresses[self.current_section] = org   # set origin
-                        elif org >= base + len(current_section_data):
-                            current_section_data.extend(            # forward skip -> pad zeros
-                                b'\x00' * (org - base - len(current_section_data)))
-                        else:
-                            self.add_error(".org cannot move backward within a section", line)
-                        self.current_address = org
-                        parser.advance()
-
-                elif directive == '.text':
-                    self.current_section = '.text'
-                    self.current_address = self.section_addresses['.text']
-                    current_section_data = self.sections['.text']
-                
-                elif directive == '.data':
-                    self.current_section = '.data'
-                    self.current_address = self.section_addresses['.data']
-                    current_section_data = self.sections['.data']
-                
-                elif directive == '.bss':
-                    self.current_section = '.bss'
-                    self.current_address = self.section_addresses['.bss']
-                    current_section_data = self.sections['.bss']
-                
-                elif directive == '.byte':
-                    while parser.current_token.type in [TokenType.IMMEDIATE, TokenType.CHARACTER]:
-                        value = int(parser.current_token.value) & 0xFF
-                        current_section_data.append(value)
-                        self.current_address += 1
-                        parser.advance()
-                        if parser.current_token.type == TokenType.COMMA:
-                            parser.advance()
-                        else:
-                            break
-                
-                elif directive == '.word':
-                    while parser.current_token.type == TokenType.IMMEDIATE:
-                        value = int(parser.current_token.value) & 0xFFFF
-                        # Little-endian encoding
-                        current_section_data.append(value & 0xFF)
-                        current_section_data.append((value >> 8) & 0xFF)
-                        self.current_address += 2
-                        parser.advance()
-                        if parser.current_token.type == TokenType.COMMA:
-                            parser.advance()
-                        else:
-                            break
-                
-                elif directive in ['.string', '.ascii']:
-                    if parser.current_token.type == TokenType.STRING:
-                        string_data = parser.current_token.value.encode('utf-8')
-                        current_section_data.extend(string_data)
-                        self.current_address += len(string_data)
-                        if directive == '.string':
-                            current_section_data.append(0)  # Null terminator
-                            self.current_address += 1
-                        parser.advance()
-                
-                elif directive == '.space':
-                    if parser.current_token.type == TokenType.IMMEDIATE:
-                        space_size = int(parser.current_token.value)
-                        current_section_data.extend([0] * space_size)
-                        self.current_address += space_size
-                        parser.advance()
-                
-                # Skip remaining tokens on this line
-                while parser.current_token.type not in [TokenType.NEWLINE, TokenType.EOF]:
-                    parser.advance()
-                continue
-            
-            # Handle instructions (including special LI handling)
-            if parser.current_token.type == TokenType.INSTRUCTION:
-                mnemonic = parser.current_token.value.lower()
-                parser.advance()
-                
-                # Parse operands
+                # Parse operands; symbols not defined yet stay as names
                 operands = []
-                while parser.current_token.type not in [TokenType.NEWLINE, TokenType.EOF, TokenType.COMMENT]:
+                forward = False
+                while parser.current_token.type not in _END_OF_OPERANDS:
                     
                     if parser.current_token.type == TokenType.COMMA:
                         parser.advance()
                         continue
                     
                     if parser.current_token.type == TokenType.REGISTER:
-                        reg_name = parser.current_token.value.lower()
-                        reg_num = parser.register_map.get(reg_name, 0)
-                        operands.append(reg_num)
+                        operands.append(parser.current_token.code)
                         parser.advance()
                     
                     elif parser.current_token.type == TokenType.IMMEDIATE:
-                        operands.append(int(parser.current_token.value))
+                        operands.append(parser.current_token.code)
                         parser.advance()
                     
                     elif parser.current_token.type == TokenType.CHARACTER:
-                        operands.append(int(parser.current_token.value))
+                        operands.append(parser.current_token.code)
                         parser.advance()
                     
                     elif parser.current_token.type == TokenType.INSTRUCTION:
                         # Symbol reference
                         symbol_name = parser.current_token.value
-                        symbol_value = self.resolve_symbol(symbol_name, line)
-                        operands.append(symbol_value)
+                        symbol_value = symbol_values.get(symbol_name)
+                        if symbol_value is None:
+                            operands.append(symbol_name)
+                            forward = True
+                        else:
+                            operands.append(symbol_value)
                         parser.advance()
                     
                     elif parser.current_token.type == TokenType.LPAREN:
                         # Memory operand: offset(register)
                         parser.advance()  # Skip '('
                         if parser.current_token.type == TokenType.REGISTER:
-                            reg_name = parser.current_token.value.lower()
-                            reg_num = parser.register_map.get(reg_name, 0)
-                            operands.append(reg_num)
+                            operands.append(parser.current_token.code)
                             parser.advance()
                         if parser.current_token.type == TokenType.RPAREN:
                             parser.advance()  # Skip ')'
@@ -999,363 +1133,334 @@ class ZX16Assembler:
                     else:
                         parser.advance()
                 
-                # Generate machine code
-                try:
-                    # Special handling for LI instruction
-                    if mnemonic == 'li':
-                        if len(operands) >= 2:
-                            rd, imm = operands[0], operands[1]
-                            
-                            # Check if immediate fits in 7-bit signed range
-                            if -64 <= imm <= 63:
-                                # Use real LI instruction (I-Type)
-                                encoding = self.encode_instruction(mnemonic, operands, parser)
-                                if isinstance(encoding, int):
-                                    current_section_data.append(encoding & 0xFF)
-                                    current_section_data.append((encoding >> 8) & 0xFF)
-                                    self.current_address += 2
-                            else:
-                                # Expand to LI16 (LUI + ORI)
-                                def symbol_resolver(name):
-                                    return self.resolve_symbol(name, line)
-                                
-                                expanded = parser.expand_pseudo_instruction('li16', [rd, imm], self.current_address, symbol_resolver)
-                                for exp_mnemonic, exp_operands in expanded:
-                                    encoding = self.encode_instruction(exp_mnemonic, exp_operands, parser)
-                                    if isinstance(encoding, int):
-                                        current_section_data.append(encoding & 0xFF)
-                                        current_section_data.append((encoding >> 8) & 0xFF)
-                                        self.current_address += 2
-                        else:
-                            raise SyntaxError("LI instruction requires 2 operands")
-                    
-                    elif mnemonic in parser.pseudo_instructions:
-                        # Handle other pseudo-instruction expansion with symbol resolution
-                        def symbol_resolver(name):
-                            return self.resolve_symbol(name, line)
-                        
-                        expanded = parser.expand_pseudo_instruction(mnemonic, operands, self.current_address, symbol_resolver)
-                        for exp_mnemonic, exp_operands in expanded:
-                            encoding = self.encode_instruction(exp_mnemonic, exp_operands, parser)
-                            if isinstance(encoding, int):
-                                # Little-endian encoding
-                                current_section_data.append(encoding & 0xFF)
-                                current_section_data.append((encoding >> 8) & 0xFF)
-                                self.current_address += 2
-                    else:
-                        # Regular instruction
-                        encoding = self.encode_instruction(mnemonic, operands, parser)
-                        if isinstance(encoding, int):
-                            # Little-endian encoding
-                            current_section_data.append(encoding & 0xFF)
-                            current_section_data.append((encoding >> 8) & 0xFF)
-                            self.current_address += 2
-                
-                except Exception as e:
-                    self.add_error(f"Error encoding instruction '{mnemonic}': {str(e)}", line)
-                    self.current_address += 2
+                size = self.instruction_size(mnemonic, operands, parser)
+                if forward:
+                    # Reserve the space now, encode once the symbol is known
+                    fixups.append((section_data, len(section_data), self.current_address,
+                                   mnemonic, mnemonic_id, operands, size, line))
+                    section_data += bytes(size)
+                    self.current_address += size
+                else:
+                    start = self.current_address
+                    try:
+                        self.emit_instruction(section_data, mnemonic, mnemonic_id, operands, size, parser)
+                    except Exception as e:
+                        self.add_error('encoding', line, mnemonic, e)
+                        # Keep the layout: pad out whatever was not emitted
+                        section_data += bytes(start + size - self.current_address)
+                        self.current_address = start + size
                 
                 continue
             
             # Skip unknown tokens
             parser.advance()
-    
-    def encode_instruction(self, mnemonic: str, operands: List[Union[int, str]], parser: ZX16Parser) -> int:
-        """Encode an instruction to machine code."""
-        mnemonic = mnemonic.lower()
         
-        # R-Type instructions
-        if mnemonic in parser.r_type_instructions:
-            funct4, func3 = parser.r_type_instructions[mnemonic]
-            
-            if mnemonic == 'jr':
-                # JR only uses rd (first operand), rs2 is ignored
-                if len(operands) < 1:
-                    raise SyntaxError(f"JR instruction requires at least 1 operand")
-                rd = operands[0]
-                rs2 = 0  # rs2 is ignored for JR
+        # Resolve forward references
+        end_section, end_address = self.current_section, self.current_address
+        for data, offset, address, mnemonic, mnemonic_id, operands, size, line in fixups:
+            operands = [self.resolve_symbol(op, line) if isinstance(op, str) else op
+                        for op in operands]
+            self.current_address = address
+            patch = bytearray()
+            try:
+                self.emit_instruction(patch, mnemonic, mnemonic_id, operands, size, parser)
+            except Exception as e:
+                self.add_error('encoding', line, mnemonic, e)
             else:
-                # Other R-type instructions need both operands
-                if len(operands) < 2:
-                    raise SyntaxError(f"R-Type instruction {mnemonic} requires 2 operands")
-                rd = operands[0]
-                rs2 = operands[1]
-            
-            encoding = (funct4 << 12) | (rs2 << 9) | (rd << 6) | (func3 << 3) | InstructionFormat.R_TYPE.value
-            return encoding
-
-        # I-Type instructions
-        elif mnemonic in parser.i_type_instructions:
+                data[offset:offset + len(patch)] = patch
+        self.current_section, self.current_address = end_section, end_address
+        
+        # Fixup diagnostics come last; report everything in source order
+        self.errors.sort(key=lambda error: error.line)
+    
+    def instruction_size(self, mnemonic: str, operands: Sequence[Union[int, str]], parser: ZX16Parser) -> int:
+        """Size in bytes of an instruction once encoded.
+        
+        A symbol operand that is still unresolved is a name; LI with such
+        an immediate is made the 4-byte LI16 form so its size is fixed now.
+        """
+        if mnemonic == 'li':
+            # LI: if immediate fits in 7 bits, it's I-Type (2 bytes)
+            # Otherwise, it's pseudo (expands to LI16 - 4 bytes), unless
+            # the peephole drops a no-op ORI (LUI alone - 2 bytes)
+            if len(operands) >= 2:
+                imm = operands[1]
+                if isinstance(imm, str):
+                    return 4
+                if not -64 <= imm <= 63:
+                    return 2 if self.peephole and imm & 0x7F == 0 else 4
+            return 2
+        return _PSEUDO_SIZES.get(mnemonic, 2)
+    
+    def emit_instruction(self, data: bytearray, mnemonic: str, mnemonic_id: int,
+                         operands: List[int], size: int, parser: ZX16Parser) -> None:
+        """Encode an instruction with resolved operands and append it to data.
+        
+        size is the instruction_size() the layout reserved; for LI it picks
+        the real instruction or LUI alone (2) or the LI16 expansion (4).
+        """
+        # Special handling for LI instruction
+        if mnemonic == 'li':
             if len(operands) < 2:
-                raise SyntaxError(f"I-Type instruction {mnemonic} requires 2 operands")
-
-            func3 = parser.i_type_instructions[mnemonic]
-            rd = operands[0]
+                raise SyntaxError("LI instruction requires 2 operands")
             imm = operands[1]
-
-            if isinstance(imm, str):
-               raise SyntaxError(f"Unresolved symbol in immediate: {imm}")
-
-            if not isinstance(imm, int):
-                raise SyntaxError(f"Immediate must be an integer or symbol, got {type(imm)}")
-
-            # The imm7 field is 7 bits wide and sign-extended at execution time.
-            # Arithmetic/compare/li immediates are signed: -64..63.
-            # Logical immediates (ORI/ANDI/XORI) are commonly written as unsigned
-            # bit masks, so also accept 0..127; the assembler stores the low 7 bits
-            # either way. This is the range LI16's ORI step relies on.
-            if mnemonic in ('ori', 'andi', 'xori'):
-                if not -64 <= imm <= 127:
-                    raise SyntaxError(
-                        f"{mnemonic.upper()} immediate out of range "
-                        f"(expected -64..127): {imm}")
+            if size == 2 and not -64 <= imm <= 63:
+                # Peephole: bits [6:0] are zero, so LI16's ORI is a no-op
+                expanded = (('lui', (operands[0], (imm >> 7) & 0x1FF)),)
+            elif size == 2:
+                # Use real LI instruction (I-Type)
+                expanded = ((mnemonic, operands),)
             else:
-                if not -64 <= imm <= 63:
-                    raise SyntaxError(f"I-type immediate out of range: {imm}")
-
-         # Encode: imm[6:0] << 9 | rd << 6 | func3 << 3 | opcode
-            encoding = ((imm & 0x7F) << 9) | (rd << 6) | (func3 << 3) | InstructionFormat.I_TYPE.value
-            return encoding
-
-        # Shift instructions (special I-Type)
-        elif mnemonic in parser.shift_instructions:
-            if len(operands) < 2:
-                raise SyntaxError(f"Shift instruction {mnemonic} requires 2 operands")
-            
-            rd = operands[0]
-            shift_amt = operands[1]
-            
-            if isinstance(shift_amt, str) or shift_amt < 0 or shift_amt > 15:
-                raise SyntaxError(f"Shift amount must be 0-15, got {shift_amt}")
-            
-            shift_type = parser.shift_instructions[mnemonic]
-            imm7 = (shift_type << 4) | (shift_amt & 0xF)
-            func3 = 0x3
-            
-            encoding = (imm7 << 9) | (rd << 6) | (func3 << 3) | InstructionFormat.I_TYPE.value
-            return encoding
-        
-        # B-Type instructions
-        elif mnemonic in parser.b_type_instructions:
-            if mnemonic in ['bz', 'bnz']:
-                if len(operands) < 2:
-                    raise SyntaxError(f"Branch instruction {mnemonic} requires 2 operands")
-                rs1, target = operands
-                rs2 = 0  # Ignored for BZ/BNZ
+                # Expand to LI16 (LUI + ORI)
+                expanded = parser.expand_pseudo_instruction('li16', operands[:2], self.current_address)
+        elif mnemonic in parser.pseudo_instructions:
+            expanded = parser.expand_pseudo_instruction(mnemonic, operands, self.current_address)
+        else:
+            # Regular instruction
+            expanded = ((mnemonic, operands),)
+        
+        for exp_mnemonic, exp_operands in expanded:
+            exp_id = mnemonic_id if exp_mnemonic is mnemonic else -1
+            encoding = self.encode_instruction(exp_mnemonic, exp_operands, parser, exp_id)
+            data += _pack_halfword(encoding & 0xFFFF)  # Little-endian encoding
+            self.current_address += 2
+    
+    def _dir_org(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.org: set the section origin, or skip forward padding with zeros."""
+        if parser.current_token.type == TokenType.IMMEDIATE:
+            org = parser.current_token.code
+            data = self.sections[self.current_section]
+            base = self.section_addresses[self.current_section]
+            # If nothing has been emitted in this section yet, .org sets
+            # the section's origin; otherwise it's a forward skip.
+            if len(data) == 0:
+                self.section_addresses[self.current_section] = org   # set origin
+            elif org >= base + len(data):
+                data += bytes(org - base - len(data))                 # forward skip -> pad zeros
             else:
-                if len(operands) < 3:
-                    raise SyntaxError(f"Branch instruction {mnemonic} requires 3 operands")
-                rs1, rs2, target = operands
-            
-            func3 = parser.b_type_instructions[mnemonic]
-            
-            if isinstance(target, str):
-                raise SyntaxError(f"Unresolved symbol in branch target: {target}")
-            
-            # Calculate relative offset
-            offset = target - (self.current_address + 2)
-            if offset < -32 or offset > 28 or offset % 2 != 0:
-                raise SyntaxError(f"Branch offset out of range or not word-aligned: {offset}")
-            
-            imm_high = (offset >> 1) & 0xF
-            encoding = (imm_high << 12) | (rs2 << 9) | (rs1 << 6) | (func3 << 3) | InstructionFormat.B_TYPE.value
-            return encoding
-        
-        # S-Type instructions
-        elif mnemonic in parser.s_type_instructions:
-            if len(operands) < 3:
-                raise SyntaxError(f"Store instruction {mnemonic} requires 3 operands")
-            
-            rs2, offset, rs1 = operands
-            func3 = parser.s_type_instructions[mnemonic]
-            
-            if isinstance(offset, str):
-                raise SyntaxError(f"Unresolved symbol in store offset: {offset}")
-            
-            if offset < -8 or offset > 7:
-                raise SyntaxError(f"Store offset out of range: {offset}")
-            
-            encoding = ((offset & 0xF) << 12) | (rs2 << 9) | (rs1 << 6) | (func3 << 3) | InstructionFormat.S_TYPE.value
-            return encoding
-        
-        # L-Type instructions
-        elif mnemonic in parser.l_type_instructions:
-            if len(operands) < 3:
-                raise SyntaxError(f"Load instruction {mnemonic} requires 3 operands")
-            
-            rd, offset, rs2 = operands
-            func3 = parser.l_type_instructions[mnemonic]
-            
-            if isinstance(offset, str):
-                raise SyntaxError(f"Unresolved symbol in load offset: {offset}")
-            
-            if offset < -8 or offset > 7:
-                raise SyntaxError(f"Load offset out of range: {offset}")
-            
-            encoding = ((offset & 0xF) << 12) | (rs2 << 9) | (rd << 6) | (func3 << 3) | InstructionFormat.L_TYPE.value
-            return encoding
-        
-        # J-Type instructions
-        elif mnemonic in ['j', 'jal']:
-            if mnemonic == 'j':
-                if len(operands) < 1:
-                    raise SyntaxError("J instruction requires 1 operand")
-                target = operands[0]
-                rd = 0
-                link = 0
-            else:  # jal
-                if len(operands) < 2:
-                    raise SyntaxError("JAL instruction requires 2 operands")
-                rd, target = operands
-                link = 1
-            
-            if isinstance(target, str):
-                raise SyntaxError(f"Unresolved symbol in jump target: {target}")
-            
-            offset = target - (self.current_address + 2)
-            # The J offset is encoded as imm[9:1] (9 bits) with imm[0]=0 and the
-            # sign bit at bit 9, so the round-trip-safe signed range is -512..+510 --
-            # NOT the -1024..+1022 the prose elsewhere claims. The old -1024..1020
-            # check accepted 511 offsets that silently miscompiled (e.g. +800 would
-            # encode and then decode as -224). Keep the check tight to the encoding.
-            if offset < -512 or offset > 510 or offset % 2 != 0:
-                raise SyntaxError(f"Jump offset out of range or not word-aligned: {offset}")
-            
-            imm_high = (offset >> 4) & 0x3F
-            imm_low = (offset >> 1) & 0x7
-            
-            encoding = (link << 15) | (imm_high << 9) | (rd << 6) | (imm_low << 3) | InstructionFormat.J_TYPE.value
-            return encoding
-        
-        # U-Type instructions
-        elif mnemonic in ['lui', 'auipc']:
-            if len(operands) < 2:
-                raise SyntaxError(f"U-Type instruction {mnemonic} requires 2 operands")
-            
-            rd, immediate = operands
-            flag = 1 if mnemonic == 'auipc' else 0
-            
-            if isinstance(immediate, str):
-                raise SyntaxError(f"Unresolved symbol in U-Type immediate: {immediate}")
-            
-            # U-Type immediate is 9 bits
-            if immediate < 0 or immediate > 0x1FF:
-                raise SyntaxError(f"U-Type immediate out of range: {immediate}")
-            
-            imm_high = (immediate >> 3) & 0x3F
-            imm_low = immediate & 0x7
-            
-            encoding = (flag << 15) | (imm_high << 9) | (rd << 6) | (imm_low << 3) | InstructionFormat.U_TYPE.value
-            return encoding
-        
-        # SYS-Type instructions
-        elif mnemonic == 'ecall':
-            if len(operands) < 1:
-                raise SyntaxError("ECALL instruction requires 1 operand")
-            
-            svc = operands[0]
-            if isinstance(svc, str):
-                raise SyntaxError(f"Unresolved symbol in system call: {svc}")
-            
-            # Handle both decimal and hex service numbers
-            if svc < 0 or svc > 0x3FF:
-                raise SyntaxError(f"System call number out of range (0-1023): {svc}")
-            
-            encoding = (svc << 6) | InstructionFormat.SYS_TYPE.value
-            return encoding
-
-        # SYS sub-functions (bits[5:3]) -- interrupts/traps, see docs/INTERRUPTS.md
-        elif mnemonic == 'ebreak':
-            return (1 << 3) | InstructionFormat.SYS_TYPE.value      # 0x000F
-        elif mnemonic == 'reti':
-            return (2 << 3) | InstructionFormat.SYS_TYPE.value      # 0x0017
-        elif mnemonic == 'ei':
-            return (3 << 3) | InstructionFormat.SYS_TYPE.value      # 0x001F
-        elif mnemonic == 'di':
-            return (4 << 3) | InstructionFormat.SYS_TYPE.value      # 0x0027
-        elif mnemonic == 'step':
-            return (7 << 3) | InstructionFormat.SYS_TYPE.value      # 0x003F
-        elif mnemonic in ('mfepc', 'mtepc'):
-            if len(operands) != 1:
-                raise SyntaxError(f"{mnemonic} requires 1 register operand")
-            rd = operands[0]
-            f3 = 5 if mnemonic == 'mfepc' else 6
-            return (rd << 6) | (f3 << 3) | InstructionFormat.SYS_TYPE.value
-
+                self.add_error('org_backward', line)
+            self.current_address = org
+            parser.advance()
         else:
-            raise SyntaxError(f"Unknown instruction: {mnemonic}")
+            self.add_error('org_address', line)
     
-    def get_binary_output(self) -> bytes:
-        """Get binary output."""
-        # Combine all sections
-        output = bytearray(65536)  # 64KB memory space
-        
-        # Write text section
-        text_start = self.section_addresses['.text']
-        text_data = self.sections['.text']
-        output[text_start:text_start + len(text_data)] = text_data
-        
-        # Write data section
-        data_start = self.section_addresses['.data']
-        data_data = self.sections['.data']
-        output[data_start:data_start + len(data_data)] = data_data
+    def _dir_section(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.text/.data/.bss: switch section."""
+        self.current_section = directive
+        self.current_address = self.section_addresses[directive]
+    
+    def _dir_equ(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.equ/.set: define a constant symbol."""
+        if parser.current_token.type == TokenType.INSTRUCTION:
+            symbol_name = parser.current_token.value
+            parser.advance()
+            if parser.current_token.type == TokenType.COMMA:
+                parser.advance()
+            if parser.current_token.type == TokenType.IMMEDIATE:
+                value = parser.current_token.code
+                self.define_symbol(symbol_name, value, line)
+                parser.advance()
+            elif parser.current_token.type == TokenType.INSTRUCTION:
+                # Symbol reference
+                ref_symbol = parser.current_token.value
+                if ref_symbol in self.symbols:
+                    value = self.symbols[ref_symbol].value
+                    self.define_symbol(symbol_name, value, line)
+                else:
+                    self.add_error('equ_undefined', line, ref_symbol)
+                parser.advance()
+            else:
+                self.add_error('equ_value', line)
+        else:
+            self.add_error('equ_name', line, directive)
+    
+    def _dir_global(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.global: mark a symbol global."""
+        if parser.current_token.type == TokenType.INSTRUCTION:
+            symbol_name = parser.current_token.value
+            if symbol_name in self.symbols:
+                self.symbols[symbol_name].global_symbol = True
+            parser.advance()
+        else:
+            self.add_error('global_name', line)
+    
+    def _dir_byte(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.byte: emit one byte per value."""
+        values = parser.take_list((TokenType.IMMEDIATE, TokenType.CHARACTER))
+        self.sections[self.current_section] += bytes([token.code & 0xFF for token in values])
+        self.current_address += len(values)
+    
+    def _dir_word(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.word: emit one little-endian halfword per value."""
+        values = parser.take_list((TokenType.IMMEDIATE,))
+        self.sections[self.current_section] += struct.pack(
+            f'<{len(values)}H', *[token.code & 0xFFFF for token in values])
+        self.current_address += 2 * len(values)
+    
+    def _dir_string(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.string/.ascii: emit the string's UTF-8 bytes (plus NUL for .string)."""
+        if parser.current_token.type == TokenType.STRING:
+            data = self.sections[self.current_section]
+            string_data = parser.current_token.value.encode('utf-8')
+            data += string_data
+            self.current_address += len(string_data)
+            if directive == '.string':
+                data.append(0)  # Null terminator
+                self.current_address += 1
+            parser.advance()
+        else:
+            self.add_error('string_expected', line, directive)
+    
+    def _dir_space(self, parser: ZX16Parser, directive: str, line: int) -> None:
+        """.space: emit zero-filled bytes."""
+        if parser.current_token.type == TokenType.IMMEDIATE:
+            space_size = parser.current_token.code
+            if space_size < 0:
+                self.add_error('space_negative', line, space_size)
+            else:
+                self.sections[self.current_section] += bytes(space_size)
+                self.current_address += space_size
+            parser.advance()
+        else:
+            self.add_error('space_size', line)
+    
+    def encode_instruction(self, mnemonic: str, operands: List[Union[int, str]], parser: ZX16Parser,
+                           mnemonic_id: int = -1) -> int:
+        """Encode an instruction to machine code.
+        
+        mnemonic_id is the mnemonic's index in _INSTRUCTIONS when the caller
+        already knows it (e.g. from the token); otherwise it is looked up.
+        Encodings that do not depend on the PC are cached per assembler, so
+        a repeated instruction skips the format dispatch.
+        """
+        if mnemonic_id < 0:
+            mnemonic_id = _MNEMONIC_ID.get(mnemonic, -1)
+            if mnemonic_id < 0:
+                mnemonic = mnemonic.lower()
+                mnemonic_id = _MNEMONIC_ID.get(mnemonic, -1)
+                if mnemonic_id < 0:
+                    raise SyntaxError(f"Unknown instruction: {mnemonic}")
+        
+        encoder, pc_relative = _ENCODE_TABLE[mnemonic_id]
+        if pc_relative:
+            return encoder(operands, self.current_address)
+        
+        key = (mnemonic_id, *operands)
+        encoding = self._encoding_cache.get(key)
+        if encoding is None:
+            encoding = encoder(operands, self.current_address)
+            if len(self._encoding_cache) < _ENCODING_CACHE_SIZE:
+                self._encoding_cache[key] = encoding
+        return encoding
+    
+    def _section_words(self, name: str) -> Tuple[int, array.array]:
+        """Start address and little-endian 16-bit words of a section.
+        
+        The words come straight from the section bytes; a trailing odd
+        byte is not part of any word.
+        """
+        data = self.sections[name]
+        words = array.array('H', data[:len(data) & ~1])
+        if sys.byteorder != 'little':
+            words.byteswap()
+        return self.section_addresses[name], words
+    
+    def get_binary_output(self, trim: bool = False) -> bytes:
+        """Get binary output.
+
+        By default this is the full 64KB memory image. With ``trim`` the
+        image stops after the last byte of the highest section, which skips
+        zero-filling unused memory for loaders that start from cleared RAM.
+        """
+        placed = [(self.section_addresses[name], self.sections[name])
+                  for name in ('.text', '.data', '.bss')]
+        if trim:
+            size = max((start + len(data) for start, data in placed if data),
+                       default=0)
+        else:
+            size = 65536  # 64KB memory space
+        output = bytearray(size)
         
-        # Write BSS section (zero-filled)
-        bss_start = self.section_addresses['.bss']
-        bss_data = self.sections['.bss']
-        output[bss_start:bss_start + len(bss_data)] = bss_data
+        for start, data in placed:
+            output[start:start + len(data)] = data
         
         return bytes(output)
     
-    def get_intel_hex_output(self) -> str:
-        """Get Intel HEX format output."""
-        lines = []
+    def get_binary_sections(self, trim: bool = False) -> List[Union[bytes, bytearray, memoryview]]:
+        """Get binary output as the ordered pieces of the image.
+        
+        The pieces are the sections and the zero padding between them, so
+        they concatenate to get_binary_output(trim) without the sections
+        being copied into an image first. If sections overlap, or run past
+        the 64KB image, the result is the single stitched image.
+        """
+        placed = sorted((self.section_addresses[name], self.sections[name])
+                        for name in ('.text', '.data', '.bss')
+                        if self.sections[name])
+        pieces: List[Union[bytes, bytearray, memoryview]] = []
+        end = 0
+        for start, data in placed:
+            if start < end or (not trim and start + len(data) > 65536):
+                return [self.get_binary_output(trim)]
+            if start > end:
+                pieces.append(_zero_fill(start - end))
+            pieces.append(data)
+            end = start + len(data)
+        if not trim and end < 65536:
+            pieces.append(_zero_fill(65536 - end))  # 64KB memory space
+        return pieces
+    
+    def iter_intel_hex_output(self) -> Iterator[str]:
+        """Generate Intel HEX format output in chunks, one per section.
         
+        The chunks concatenate to get_intel_hex_output().
+        """
         def write_hex_line(address: int, data: bytes, record_type: int = 0) -> str:
-            line = f":{len(data):02X}{address:04X}{record_type:02X}"
-            line += data.hex().upper()
-            
-            # Calculate checksum
-            checksum = len(data) + (address >> 8) + (address & 0xFF) + record_type
-            for byte in data:
-                checksum += byte
-            checksum = (-checksum) & 0xFF
-            
-            line += f"{checksum:02X}"
-            return line
-        
-        # Write text section
-        text_data = self.sections['.text']
-        if text_data:
-            text_start = self.section_addresses['.text']
-            for i in range(0, len(text_data), 16):
-                chunk = text_data[i:i + 16]
-                lines.append(write_hex_line(text_start + i, chunk))
-        
-        # Write data section
-        data_data = self.sections['.data']
-        if data_data:
-            data_start = self.section_addresses['.data']
-            for i in range(0, len(data_data), 16):
-                chunk = data_data[i:i + 16]
-                lines.append(write_hex_line(data_start + i, chunk))
-        
-        # Write BSS section (zero-filled)
-        bss_data = self.sections['.bss']
-        if bss_data:
-            bss_start = self.section_addresses['.bss']
-            for i in range(0, len(bss_data), 16):
-                chunk = bss_data[i:i + 16]
-                lines.append(write_hex_line(bss_start + i, chunk))
+            # Byte count, address and type go through the same C-level hex()
+            # and sum() as the data, so each record costs two calls
+            record = bytes((len(data), (address >> 8) & 0xFF, address & 0xFF,
+                            record_type)) + data
+            return f":{record.hex().upper()}{-sum(record) & 0xFF:02X}\n"
+        
+        # Write text, data and BSS (zero-filled) sections in 16-byte records.
+        # Data past 0xFFFF is placed with type-04 extended linear address
+        # records, and no data record crosses a 64KB boundary.
+        upper = 0
+        for name in ('.text', '.data', '.bss'):
+            section_data = self.sections[name]
+            start = self.section_addresses[name]
+            if not section_data:
+                continue
+            if upper == 0 and start + len(section_data) <= 0x10000:
+                yield ''.join([write_hex_line(start + i, section_data[i:i + 16])
+                               for i in range(0, len(section_data), 16)])
+                continue
+            records = []
+            address, offset = start, 0
+            while offset < len(section_data):
+                if address >> 16 != upper:
+                    upper = address >> 16
+                    records.append(write_hex_line(0, upper.to_bytes(2, 'big'), 0x04))
+                size = min(16, len(section_data) - offset, 0x10000 - (address & 0xFFFF))
+                records.append(write_hex_line(address & 0xFFFF,
+                                              section_data[offset:offset + size]))
+                address += size
+                offset += size
+            yield ''.join(records)
         
         # End of file record
-        lines.append(":00000001FF")
-        
-        return '\n'.join(lines)
+        yield ":00000001FF"
     
-    def get_verilog_output(self, module_name: str = "program_memory") -> str:
-        """Get Verilog module output."""
-        lines = [
+    def get_intel_hex_output(self) -> str:
+        """Get Intel HEX format output."""
+        return ''.join(self.iter_intel_hex_output())
+    
+    def iter_verilog_output(self, module_name: str = "program_memory") -> Iterator[str]:
+        """Generate Verilog module output in chunks, one per section.
+        
+        The chunks concatenate to get_verilog_output().
+        """
+        yield '\n'.join([
             "// ZX16 Program Memory Initialization",
             "// Generated by ZX16 Assembler",
             "",
@@ -1366,137 +1471,90 @@ class ZX16Assembler:
             "",
             "always @(*) begin",
             "    case (addr)"
-        ]
-        
-        # Add text section data
-        text_data = self.sections['.text']
-        text_start = self.section_addresses['.text']
-        for i in range(0, len(text_data), 2):
-            if i + 1 < len(text_data):
-                word = text_data[i] | (text_data[i + 1] << 8)
-                addr = text_start + i
-                lines.append(f"        16'h{addr:04X}: data = 16'h{word:04X};")
-        
-        # Add data section data
-        data_data = self.sections['.data']
-        data_start = self.section_addresses['.data']
-        for i in range(0, len(data_data), 2):
-            if i + 1 < len(data_data):
-                word = data_data[i] | (data_data[i + 1] << 8)
-                addr = data_start + i
-                lines.append(f"        16'h{addr:04X}: data = 16'h{word:04X};")
-        
-        # Add BSS section data (zero-filled)
-        bss_data = self.sections['.bss']
-        bss_start = self.section_addresses['.bss']
-        for i in range(0, len(bss_data), 2):
-            if i + 1 < len(bss_data):
-                word = bss_data[i] | (bss_data[i + 1] << 8)
-                addr = bss_start + i
-                lines.append(f"        16'h{addr:04X}: data = 16'h{word:04X};")
+        ])
         
-        lines.extend([
+        # Text, data and BSS (zero-filled) sections, one case per word;
+        # each section's cases are formatted by one %-operation as in
+        # iter_memory_file_output
+        case_line = "\n        16'h%04X: data = 16'h%04X;"
+        for name in ('.text', '.data', '.bss'):
+            start, words = self._section_words(name)
+            if words:
+                addrs = range(start, start + 2 * len(words), 2)
+                yield ((case_line * len(words))
+                       % tuple(itertools.chain.from_iterable(zip(addrs, words))))
+        
+        yield '\n' + '\n'.join([
             "        default: data = 16'h0000;",
             "    endcase",
             "end",
             "",
             "endmodule"
         ])
-        
-        return '\n'.join(lines)
     
-    def get_memory_file_output(self, sparse: bool = False) -> str:
-        """Get memory file output for $readmemh."""
+    def get_verilog_output(self, module_name: str = "program_memory") -> str:
+        """Get Verilog module output."""
+        return ''.join(self.iter_verilog_output(module_name))
+    
+    def iter_memory_file_output(self, sparse: bool = False) -> Iterator[str]:
+        """Generate memory file output for $readmemh in chunks.
+        
+        The chunks concatenate to get_memory_file_output().
+        """
+        # Lines are produced by C-level formatting of whole sections, never
+        # one f-string per word
         if sparse:
-            lines = ["# ZX16 Sparse Memory File"]
+            yield "# ZX16 Sparse Memory File"
             
-            # Text section
-            text_data = self.sections['.text']
-            text_start = self.section_addresses['.text']
-            for i in range(0, len(text_data), 2):
-                if i + 1 < len(text_data):
-                    word = text_data[i] | (text_data[i + 1] << 8)
-                    addr = text_start + i
-                    lines.append(f"@{addr:04X} {word:04X}")
-            
-            # Data section
-            data_data = self.sections['.data']
-            data_start = self.section_addresses['.data']
-            for i in range(0, len(data_data), 2):
-                if i + 1 < len(data_data):
-                    word = data_data[i] | (data_data[i + 1] << 8)
-                    addr = data_start + i
-                    lines.append(f"@{addr:04X} {word:04X}")
-            
-            # BSS section (zero-filled)
-            bss_data = self.sections['.bss']
-            bss_start = self.section_addresses['.bss']
-            for i in range(0, len(bss_data), 2):
-                if i + 1 < len(bss_data):
-                    word = bss_data[i] | (bss_data[i + 1] << 8)
-                    addr = bss_start + i
-                    lines.append(f"@{addr:04X} {word:04X}")
+            # Text, data and BSS (zero-filled) sections, each by one
+            # %-operation over a repeated line template
+            for name in ('.text', '.data', '.bss'):
+                start, words = self._section_words(name)
+                addrs = range(start, start + 2 * len(words), 2)
+                yield (("\n@%04X %04X" * len(words))
+                       % tuple(itertools.chain.from_iterable(zip(addrs, words))))
         
         else:
-            lines = ["# ZX16 Memory File"]
-            memory = [0] * 32768  # 64KB / 2 bytes per word
-            
-            # Fill text section
-            text_data = self.sections['.text']
-            text_start = self.section_addresses['.text'] // 2
-            for i in range(0, len(text_data), 2):
-                if i + 1 < len(text_data):
-                    word = text_data[i] | (text_data[i + 1] << 8)
-                    memory[text_start + i // 2] = word
-            
-            # Fill data section
-            data_data = self.sections['.data']
-            data_start = self.section_addresses['.data'] // 2
-            for i in range(0, len(data_data), 2):
-                if i + 1 < len(data_data):
-                    word = data_data[i] | (data_data[i + 1] << 8)
-                    memory[data_start + i // 2] = word
-            
-            # Fill BSS section (zero-filled)
-            bss_data = self.sections['.bss']
-            bss_start = self.section_addresses['.bss'] // 2
-            for i in range(0, len(bss_data), 2):
-                if i + 1 < len(bss_data):
-                    word = bss_data[i] | (bss_data[i + 1] << 8)
-                    memory[bss_start + i // 2] = word
-            
-            # Output all memory words
-            for word in memory:
-                lines.append(f"{word:04X}")
-        
-        return '\n'.join(lines)
+            yield "# ZX16 Memory File"
+            memory = array.array('H', bytes(65536))  # 64KB / 2 bytes per word
+            
+            # Fill text, data and BSS (zero-filled) sections
+            for name in ('.text', '.data', '.bss'):
+                start, words = self._section_words(name)
+                start //= 2
+                memory[start:start + len(words)] = words[:max(0, len(memory) - start)]
+            
+            # Output all memory words: as big-endian bytes, hex() with a
+            # separator every 2 bytes yields one 4-digit word per line
+            if sys.byteorder == 'little':
+                memory.byteswap()
+            yield "\n" + memory.tobytes().hex("\n", 2).upper()
     
-    def get_listing_output(self, source_lines: List[str]) -> str:
-        """Generate assembly listing."""
-        lines = [
-            "ZX16 Assembler Listing",
-            "=" * 50,
-            "",
-        ]
+    def get_memory_file_output(self, sparse: bool = False) -> str:
+        """Get memory file output for $readmemh."""
+        return ''.join(self.iter_memory_file_output(sparse))
+    
+    def iter_listing_output(self, source_lines: Sequence[str]) -> Iterator[str]:
+        """Generate the assembly listing in chunks, one per part.
+        
+        The chunks concatenate to get_listing_output(); every line after
+        the first is emitted with its leading newline.
+        """
+        yield "ZX16 Assembler Listing\n" + "=" * 50 + "\n"
         
         # Add source with line numbers
-        for i, source_line in enumerate(source_lines, 1):
-            line_output = f"{i:4d}      {source_line}"
-            lines.append(line_output)
+        yield ''.join([f"\n{i:4d}      {source_line}"
+                       for i, source_line in enumerate(source_lines, 1)])
         
-        lines.extend([
-            "",
-            "Symbol Table:",
-            "-" * 30
-        ])
+        yield "\n\nSymbol Table:\n" + "-" * 30
         
         # Add symbol table
-        for name, symbol in sorted(self.symbols.items()):
-            if symbol.defined and not name.startswith('__'):
-                scope = "global" if symbol.global_symbol else "local"
-                lines.append(f"{name:<20} = 0x{symbol.value:04X}  ({scope})")
+        yield ''.join([f"\n{name:<20} = 0x{symbol.value:04X}  "
+                       f"({'global' if symbol.global_symbol else 'local'})"
+                       for name, symbol in sorted(self.symbols.items())
+                       if symbol.defined and not name.startswith('__')])
         
-        lines.extend([
+        yield '\n' + '\n'.join([
             "",
             "Statistics:",
             f"  Code size:    {len(self.sections['.text'])} bytes",
@@ -1506,8 +1564,10 @@ class ZX16Assembler:
             f"  Symbols:      {len([s for s in self.symbols.values() if s.defined])}",
             f"  Lines:        {len(source_lines)}"
         ])
-        
-        return '\n'.join(lines)
+    
+    def get_listing_output(self, source_lines: List[str]) -> str:
+        """Generate assembly listing."""
+        return ''.join(self.iter_listing_output(source_lines))
     
     def print_errors(self) -> None:
         """Print all errors and warnings."""
@@ -1526,19 +1586,151 @@ class ZX16Assembler:
             print("Assembly completed successfully.")
 
 
+# Payloads of known size at least this large are preallocated; below it
+# the extra calls cost more than they save
+_PREALLOCATE_THRESHOLD = 64 * 1024
+
+# Most pieces one os.writev call takes (the POSIX minimum for IOV_MAX)
+_IOV_MAX = 16
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserve size bytes for a file about to be written sequentially.
+    
+    Allocating the blocks up front avoids growing the file extent by
+    extent as it is written, and the access hint lets the kernel plan
+    for one sequential pass. Both are best effort: platforms without the
+    calls, and files that do not support them (pipes, devices), are
+    written as before.
+    """
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+    except OSError:
+        pass
+
+
+def _write_output(path: Union[str, Path], data: Union[bytes, Sequence[bytes], Iterable[bytes]]) -> None:
+    """Write a payload to path, replacing the file.
+    
+    data is the complete payload, a list of pieces making it up, or an
+    iterable of chunks written as they are produced. The bytes go to the
+    kernel directly, with no buffered writer in between to copy them
+    through: a payload or list is gathered by os.writev, and anything
+    else is written with os.write. Both calls may accept less than
+    asked, so they loop; one that accepts nothing raises OSError rather
+    than retrying forever. Large payloads of known size are preallocated
+    first.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = (data,)
+    
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        if isinstance(data, (list, tuple)) and hasattr(os, 'writev'):
+            views = [memoryview(piece) for piece in data if len(piece)]
+            size = sum(len(view) for view in views)
+            if size >= _PREALLOCATE_THRESHOLD:
+                _preallocate(fd, size)
+            while views:
+                written = os.writev(fd, views[:_IOV_MAX])
+                if not written:
+                    raise OSError(errno.EIO, f"No bytes written to {path}")
+                # Drop the pieces written in full, trim a partial one
+                while views and written >= len(views[0]):
+                    written -= len(views.pop(0))
+                if written:
+                    views[0] = views[0][written:]
+            return
+        for chunk in data:
+            view = memoryview(chunk)
+            while view:
+                written = os.write(fd, view)
+                if not written:
+                    raise OSError(errno.EIO, f"No bytes written to {path}")
+                view = view[written:]
+    finally:
+        os.close(fd)
+
+
+def _emit_output(job: Tuple[Union[str, Path], Any]) -> None:
+    """Run one output job: produce its payload and write it to its path."""
+    path, produce = job
+    _write_output(path, produce())
+
+
+def _same_file(path: Union[str, Path], other: Union[str, Path]) -> bool:
+    """Whether two output paths name the same file."""
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        # Not both created yet: compare where they would be
+        return os.path.realpath(path) == os.path.realpath(other)
+
+
+def _encode_chunks(chunks: Iterable[str], encoding: str = 'utf-8') -> Iterator[bytes]:
+    """Encode text output chunks as they are produced."""
+    return (chunk.encode(encoding) for chunk in chunks)
+
+
+# Output format -> (default file suffix, producer). A producer takes the
+# assembler and the parsed arguments and returns a _write_output payload.
+# Hex and memory files are pure ASCII by construction; Verilog output
+# embeds the user's module name and stays UTF-8.
+_FORMAT_TABLE = {
+    "bin": ('.bin', lambda assembler, args: assembler.get_binary_sections(trim=args.trim)),
+    "hex": ('.hex', lambda assembler, args: _encode_chunks(
+        assembler.iter_intel_hex_output(), 'ascii')),
+    "verilog": ('.v', lambda assembler, args: _encode_chunks(
+        assembler.iter_verilog_output(args.verilog_module))),
+    "mem": ('.mem', lambda assembler, args: _encode_chunks(
+        assembler.iter_memory_file_output(args.mem_sparse), 'ascii')),
+}
+
+# Assembler attributes carried back from an assemble_files() worker
+_ASSEMBLY_STATE = ('symbols', '_symbol_values', 'instructions', 'errors', 'warnings',
+                   'sections', 'section_addresses', 'current_address', 'current_section')
+
+
+def _assemble_file(path: str, verbose: bool = False, peephole: bool = True) -> Dict[str, Any]:
+    """Worker for ZX16Assembler.assemble_files: assemble one file.
+    
+    Returns the assembler's state as plain data so it pickles cheaply
+    back to the parent process.
+    """
+    assembler = ZX16Assembler()
+    assembler.verbose = verbose
+    assembler.peephole = peephole
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            source_code = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        # Undecodable text is this file's error, not the whole batch's
+        assembler.add_error('read_error', 0, path, e)
+    else:
+        assembler.assemble(source_code, path)
+    return {name: getattr(assembler, name) for name in _ASSEMBLY_STATE}
+
+
 def main():
     """Main entry point for the assembler."""
     parser = argparse.ArgumentParser(description="ZX16 Assembler")
     parser.add_argument("input", help="Input assembly file")
     parser.add_argument("-o", "--output", help="Output file")
-    parser.add_argument("-f", "--format", choices=["bin", "hex", "verilog", "mem"],
+    parser.add_argument("-f", "--format", choices=list(_FORMAT_TABLE),
                        default="bin", help="Output format")
     parser.add_argument("-l", "--listing", help="Generate listing file")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
     parser.add_argument("--verilog-module", default="program_memory",
                        help="Verilog module name")
+    parser.add_argument("--no-peephole", action="store_true",
+                       help="Always expand out-of-range LI to LUI+ORI")
     parser.add_argument("--mem-sparse", action="store_true",
                        help="Generate sparse memory file")
+    parser.add_argument("--trim", action="store_true",
+                       help="End binary output at the last used byte instead of 64KB")
     
     args = parser.parse_args()
     
@@ -1546,7 +1738,6 @@ def main():
     try:
         with open(args.input, 'r', encoding='utf-8') as f:
             source_code = f.read()
-            source_lines = source_code.splitlines()
     except FileNotFoundError:
         print(f"Error: Input file '{args.input}' not found", file=sys.stderr)
         return 1
@@ -1557,6 +1748,7 @@ def main():
     # Create assembler
     assembler = ZX16Assembler()
     assembler.verbose = args.verbose
+    assembler.peephole = not args.no_peephole
     
     # Assemble
     success = assembler.assemble(source_code, args.input)
@@ -1568,56 +1760,43 @@ def main():
         return 1
     
     # Generate output
+    suffix, produce_output = _FORMAT_TABLE[args.format]
     if args.output:
         output_file = args.output
     else:
-        # Generate default output filename
-        input_path = Path(args.input)
-        if args.format == "bin":
-            output_file = input_path.with_suffix('.bin')
-        elif args.format == "hex":
-            output_file = input_path.with_suffix('.hex')
-        elif args.format == "verilog":
-            output_file = input_path.with_suffix('.v')
-        elif args.format == "mem":
-            output_file = input_path.with_suffix('.mem')
+        # Generate default output filename: the input with its suffix replaced
+        output_file = os.path.splitext(args.input)[0] + suffix
     
+    # One (path, producer) job per file: output, then the listing. Separate
+    # files are independent, so they are produced and written on a thread
+    # pool, each file's os.write overlapping the other's formatting. A
+    # listing given the output's own path is written after it, so the
+    # listing always wins, as it always has.
+    jobs = [(output_file, lambda: produce_output(assembler, args))]
+    if args.listing:
+        jobs.append((args.listing,
+                     lambda: _encode_chunks(assembler.iter_listing_output(source_code.splitlines()))))
     try:
-        if args.format == "bin":
-            output_data = assembler.get_binary_output()
-            with open(output_file, 'wb') as f:
-                f.write(output_data)
-        
-        elif args.format == "hex":
-            output_data = assembler.get_intel_hex_output()
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(output_data)
-        
-        elif args.format == "verilog":
-            output_data = assembler.get_verilog_output(args.verilog_module)
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(output_data)
-        
-        elif args.format == "mem":
-            output_data = assembler.get_memory_file_output(args.mem_sparse)
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(output_data)
-        
-        if args.verbose:
-            print(f"Output written to {output_file}")
-        
-        # Generate listing file if requested
-        if args.listing:
-            listing_content = assembler.get_listing_output(source_lines)
-            with open(args.listing, 'w', encoding='utf-8') as f:
-                f.write(listing_content)
-            if args.verbose:
-                print(f"Listing written to {args.listing}")
-        
+        if len(jobs) == 1 or _same_file(output_file, args.listing):
+            for job in jobs:
+                _emit_output(job)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+                for _ in pool.map(_emit_output, jobs):
+                    pass
     except IOError as e:
         print(f"Error writing output file: {e}", file=sys.stderr)
         return 1
     
+    if args.verbose:
+        # One write and one flush for both messages; a line-buffered stdout
+        # would flush after every print() and every newline in a write
+        written = f"Output written to {output_file}\n"
+        if args.listing:
+            written += f"Listing written to {args.listing}\n"
+        sys.stdout.write(written)
+        sys.stdout.flush()
+    
     return 0
 
 